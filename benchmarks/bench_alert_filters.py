@@ -0,0 +1,58 @@
+"""Compare the compiled alert filter index with the per-alert filter walk.
+
+Run with: python3 benchmarks/bench_alert_filters.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "icebox"))
+
+from modules.alert_filters import AlertFilterIndex  # noqa: E402
+from modules.logger import Logger  # noqa: E402
+
+SUBJECT = "icebox1: Unknown MAC address detected"
+BODY = (
+    "An unknown MAC address was detected.\n\n2024-10-18T12:00:00 icebox1 kernel: "
+    "SNOWDOG: IN=eth0 OUT= MAC=ff:ff:ff:ff:ff:ff:0a:1b:2c:3d:4e:5f:08:00 "
+    "SRC=10.0.0.23 DST=255.255.255.255 LEN=328 TTL=64 PROTO=UDP SPT=68 DPT=67"
+)
+
+
+def suppression_list(count):
+    macs = [f"dc:a6:32:00:{i >> 8:02x}:{i & 255:02x}" for i in range(count)]
+    return [{"source": "snowdog", "subject": "", "body": mac} for mac in macs]
+
+
+def walk_filters(alert_filters, source, subject, body):
+    filtered = False
+    for filter in alert_filters:
+        if filter["source"] == source:
+            if filter["subject"] and filter["body"]:
+                if filter["subject"] in subject and filter["body"] in body:
+                    filtered = True
+            elif filter["subject"] and filter["subject"] in subject:
+                filtered = True
+            elif filter["body"] and filter["body"] in body:
+                filtered = True
+    return filtered
+
+
+def bench(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{name:<36} {seconds / number * 1e6:10.2f} us/alert")
+
+
+if __name__ == "__main__":
+    Logger.configure(log_file="/dev/null", log_level="WARNING")
+    for count in (10, 1000, 10000):
+        alert_filters = suppression_list(count)
+        index = AlertFilterIndex(alert_filters)
+        print(f"{count} filters")
+        bench(
+            "  walk every filter",
+            lambda: walk_filters(alert_filters, "snowdog", SUBJECT, BODY),
+            max(100000 // count, 10),
+        )
+        bench("  compiled index", lambda: index.matches("snowdog", SUBJECT, BODY), 2000)
@@ -0,0 +1,82 @@
+"""Measure config reads per second while updates arrive.
+
+Several reader threads read snowdog.learning the way the old locked get()
+did, through the lock-free get(), and through an accessor, while a writer
+thread publishes a new config every millisecond and an observer callback
+takes a little time on each update.
+
+Run with: python3 benchmarks/bench_config_store.py
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "icebox"))
+
+from modules.config_store import ConfigStore  # noqa: E402
+from modules.logger import Logger  # noqa: E402
+
+READERS = 4
+DURATION = 1.0
+
+
+def locked_get(store, key, default=None):
+    """ConfigStore.get as it was: take the lock and split the key per call."""
+    with store._lock:
+        try:
+            value = store._snapshot.config
+            for k in key.split("."):
+                value = value[k]
+            return value
+        except (KeyError, TypeError):
+            return default
+
+
+def slow_observer(value):
+    time.sleep(0.0002)
+
+
+def run(name, read):
+    store = ConfigStore()
+    stop = threading.Event()
+    counts = [0] * READERS
+
+    def reader(slot):
+        count = 0
+        while not stop.is_set():
+            for _ in range(100):
+                read()
+            count += 100
+        counts[slot] = count
+
+    def writer():
+        version = 0
+        while not stop.is_set():
+            version += 1
+            store.update_config(
+                {"snowdog": {"learning": version % 2 == 0, "alerting": True}}
+            )
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(READERS)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"{name:<16} {sum(counts) / DURATION / 1e6:8.2f} M reads/s")
+
+
+if __name__ == "__main__":
+    Logger.configure(log_file="/dev/null", log_level="WARNING")
+    store = ConfigStore()
+    store.watch("snowdog", slow_observer)
+    learning = store.accessor("snowdog.learning")
+    print(f"{READERS} readers, config updated every millisecond")
+    run("locked get()", lambda: locked_get(store, "snowdog.learning"))
+    run("get()", lambda: store.get("snowdog.learning"))
+    run("accessor.value", lambda: learning.value)
@@ -0,0 +1,105 @@
+"""Measure how long Icepick takes to probe every rule once.
+
+The scheduler is run as in production, with a short interval so that
+every rule is due at the start, and timed until each rule has a result.
+
+A quarter of the rules target a listening socket and the rest a listener
+whose accept queue is full, so the kernel drops their SYNs the way a
+blackholing firewall would and each of those probes runs to its timeout.
+
+Run with: python3 benchmarks/bench_icepick_sweep.py
+"""
+
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "icebox"))
+
+from modules.logger import Logger  # noqa: E402
+from modules.config_store import ConfigStore  # noqa: E402
+from icepick import Icepick  # noqa: E402
+
+TIMEOUT = 0.2
+INTERVAL = 0.05
+RULE_COUNTS = [10, 50, 200]
+
+
+def open_listener():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(128)
+    return server
+
+
+def filtered_listener():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(0)
+    clients = []
+    while True:
+        client = socket.socket()
+        client.settimeout(TIMEOUT)
+        try:
+            client.connect(server.getsockname())
+        except socket.timeout:
+            client.close()
+            return server, clients
+        clients.append(client)
+
+
+def rules(count, reachable, filtered):
+    connections = []
+    for i in range(count):
+        host, port = (reachable if i % 4 == 0 else filtered).getsockname()
+        connections.append(
+            {
+                "id": i,
+                "name": f"rule {i}",
+                "host": host,
+                "port": port,
+                "interval": INTERVAL,
+                "jitter": 0,
+                "success_action": "pass",
+                "failure_action": "pass",
+            }
+        )
+    return connections
+
+
+def sweep_time(connections, max_in_flight):
+    ConfigStore().update_config(
+        {"icepick_settings": {"max_in_flight": max_in_flight, "timeout": TIMEOUT}}
+    )
+    # max_in_flight is read when the scheduler starts, so start a fresh one
+    Icepick._instance = None
+    Icepick._initialized = False
+    icepick = Icepick()
+    icepick.set_connections(connections)
+    thread = threading.Thread(target=icepick.run, daemon=True)
+
+    start = time.monotonic()
+    thread.start()
+    while len({r["ruleId"] for r in icepick.get_latest_results()}) < len(connections):
+        time.sleep(0.005)
+    elapsed = time.monotonic() - start
+
+    icepick.stop()
+    thread.join()
+    return elapsed
+
+
+if __name__ == "__main__":
+    # The short interval makes the scheduler warn about every skipped probe
+    Logger.configure(log_file="/dev/null", log_level="ERROR")
+    reachable = open_listener()
+    filtered, clients = filtered_listener()
+
+    print(f"probe timeout {TIMEOUT}s")
+    print(f"{'rules':>6} {'serial':>10} {'32 in flight':>14} {'256 in flight':>14}")
+    for count in RULE_COUNTS:
+        connections = rules(count, reachable, filtered)
+        times = [sweep_time(connections, n) for n in (1, 32, 256)]
+        print(f"{count:>6} {times[0]:>9.2f}s {times[1]:>13.2f}s {times[2]:>13.2f}s")
@@ -0,0 +1,75 @@
+"""Compare the single-pass PacketRecord parser with the regexes it replaced.
+
+Run with: python3 benchmarks/bench_packet_parser.py
+"""
+
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "icebox"))
+
+from modules.mac import format_mac  # noqa: E402
+from modules.packet import PacketRecord  # noqa: E402
+
+TCP_LINE = (
+    "2024-10-18T12:00:00.000000+00:00 icebox1 kernel: [12345.678901] ICICLE: "
+    "IN=eth0 OUT= MAC=dc:a6:32:01:02:03:0a:1b:2c:3d:4e:5f:08:00 SRC=10.0.0.23 "
+    "DST=10.0.0.5 LEN=60 TOS=0x00 PREC=0x00 TTL=64 ID=54321 DF PROTO=TCP "
+    "SPT=51234 DPT=22 WINDOW=64240 RES=0x00 SYN URGP=0"
+)
+ICMP_LINE = (
+    "2024-10-18T12:00:00.000000+00:00 icebox1 kernel: [12345.678901] ICICLE: "
+    "IN=eth0 OUT= MAC=dc:a6:32:01:02:03:0a:1b:2c:3d:4e:5f:08:00 SRC=10.0.0.23 "
+    "DST=10.0.0.5 LEN=84 TOS=0x00 PREC=0x00 TTL=64 ID=1 DF PROTO=ICMP TYPE=8 "
+    "CODE=0 ID=7 SEQ=1"
+)
+
+
+def icicle_regex(message):
+    proto = re.search(r"PROTO=([0-9A-Za-z]*)", message)[1]
+    if proto == "ICMP":
+        message += " DPT=0"
+        int(re.search(r"PROTO=ICMP TYPE=([0-9]*)", message)[1])
+    src_address = re.search(r"SRC=([0-9A-Fa-f:\.]*)", message)[1]
+    dest_port = int(re.search(r"DPT=([0-9]*)", message)[1])
+    return src_address, dest_port
+
+
+def icicle_record(message):
+    packet = PacketRecord(message)
+    if packet.proto == "ICMP":
+        packet.icmp_type
+        return packet.src, 0
+    return packet.src, packet.dpt
+
+
+def snowdog_regex(message):
+    mac_match = re.search(r"MAC=((?:[a-f0-9]{2}:){12}[a-f0-9]{2})", message)
+    parts = mac_match.group(1).split(":")
+    return ":".join(parts[6:12]), ":".join(parts[0:6])
+
+
+def snowdog_record(message):
+    return PacketRecord(message).mac_addresses
+
+
+def snowdog_record_formatted(message):
+    src_mac, dst_mac = PacketRecord(message).mac_addresses
+    return format_mac(src_mac), format_mac(dst_mac)
+
+
+def bench(name, func, line, number=100000):
+    seconds = min(timeit.repeat(lambda: func(line), number=number, repeat=5))
+    print(f"{name:<36} {seconds / number * 1e6:6.2f} us/line")
+
+
+if __name__ == "__main__":
+    bench("icicle tcp, regexes", icicle_regex, TCP_LINE)
+    bench("icicle tcp, PacketRecord", icicle_record, TCP_LINE)
+    bench("icicle icmp, regexes", icicle_regex, ICMP_LINE)
+    bench("icicle icmp, PacketRecord", icicle_record, ICMP_LINE)
+    bench("snowdog macs, regex", snowdog_regex, TCP_LINE)
+    bench("snowdog macs, PacketRecord", snowdog_record, TCP_LINE)
+    bench("snowdog macs, PacketRecord + format", snowdog_record_formatted, TCP_LINE)
@@ -0,0 +1,87 @@
+"""Measure known-MAC lookup latency at 10k and 1M stored addresses.
+
+Compares the original per-call connection against an unindexed table with
+the integer-keyed, persistent-connection storage engine and its in-memory set.
+
+Run with: python3 benchmarks/bench_sqlite_lookup.py
+"""
+
+import random
+import sqlite3
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "icebox"))
+
+from modules.logger import Logger  # noqa: E402
+from modules.mac import parse_mac  # noqa: E402
+from modules.sqlite import SQLiteDB  # noqa: E402
+
+LOOKUP_SQL = "SELECT EXISTS(SELECT 1 FROM mac_addresses WHERE mac_address = ?)"
+
+
+def random_macs(count):
+    rng = random.Random(count)
+    return [rng.getrandbits(48).to_bytes(6, "big").hex(":") for _ in range(count)]
+
+
+def create_unindexed_db(db_path, macs):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE mac_addresses (id INTEGER PRIMARY KEY, "
+            "mac_address TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO mac_addresses (mac_address) VALUES (?)",
+            [(mac,) for mac in macs],
+        )
+
+
+def old_lookup(db_path, mac):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(LOOKUP_SQL, (mac,)).fetchone()[0] == 1
+
+
+def bench(name, func, probes, number):
+    probe = iter(probes * (number * 5 // len(probes) + 1))
+    seconds = min(timeit.repeat(lambda: func(next(probe)), number=number, repeat=5))
+    print(f"{name:<44} {seconds / number * 1e6:10.2f} us/lookup")
+
+
+def run(rows, old_number):
+    macs = random_macs(rows)
+    # Half hits, half misses
+    probes = random.Random(0).sample(macs, 500) + random_macs(500)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = str(Path(directory) / "snowdog.db")
+        create_unindexed_db(db_path, macs)
+        print(f"{rows} rows")
+        bench(
+            "  connect per call, full scan",
+            lambda mac: old_lookup(db_path, mac),
+            probes,
+            old_number,
+        )
+
+        # Opening the engine migrates the table to integer primary keys
+        db = SQLiteDB(db_path, flush_interval=3600)
+        conn = sqlite3.connect(db_path)
+        probes = [parse_mac(mac) for mac in probes]
+        bench(
+            "  persistent connection, integer key",
+            lambda mac: conn.execute(LOOKUP_SQL, (mac,)).fetchone()[0] == 1,
+            probes,
+            10000,
+        )
+        bench("  SQLiteDB.is_known_mac (in memory)", db.is_known_mac, probes, 100000)
+        conn.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    Logger.configure(log_file="/dev/null", log_level="WARNING")
+    run(10_000, old_number=200)
+    run(1_000_000, old_number=5)
@@ -53,9 +53,6 @@ mkdir -p /opt/icebox/icebox
 mkdir -p /etc/icebox
 mkdir -p /var/log/icebox
 
-touch /etc/icebox/config-icewatch.json
-chown $ICEBOX_USER:$ICEBOX_USER /etc/icebox/config-icewatch.json
-
 gecho "Installing Icebox"
 DEPLOY_DIR=$(mktemp -d)
 cd "$DEPLOY_DIR"
@@ -74,6 +71,11 @@ else
     gecho "Using existing config"
 fi
 
+if [ -f /etc/icebox/config-icewatch.json ]; then
+    gecho "Moving cached Icewatch config to /opt/icebox"
+    mv /etc/icebox/config-icewatch.json /opt/icebox/config-icewatch.json
+fi
+
 chown -R $ICEBOX_USER:$ICEBOX_USER /opt/icebox
 chown -R $ICEBOX_USER:$ICEBOX_USER /var/log/icebox
 chmod -R g+x /opt/icebox/icebox
@@ -23,16 +23,21 @@ def signal_handler(signum: int, frame: any) -> None:
     shutdown_flag.set()
 
 
-def start_ice_cube_thread(ice_cube_name: str) -> tuple:
+def create_ice_cube(ice_cube_name: str) -> any:
     logger = Logger.get_logger("startup")
-    logger.debug(f"Starting {ice_cube_name}")
+    logger.debug(f"Creating {ice_cube_name}")
     ice_cube = importlib.import_module(ice_cube_name)
     ice_cube_class = getattr(ice_cube, ice_cube_name.capitalize())
-    instance = ice_cube_class()
+    return ice_cube_class()
+
+
+def start_ice_cube_thread(ice_cube_name: str, instance: any) -> threading.Thread:
+    logger = Logger.get_logger("startup")
+    logger.debug(f"Starting {ice_cube_name}")
     thread = threading.Thread(target=instance.run, daemon=True)
     thread.start()
     logger.debug(f"Started {ice_cube_name} thread")
-    return thread, instance
+    return thread
 
 
 def init_config() -> None:
@@ -95,12 +100,19 @@ def main() -> None:
         log_file=config_store.get("log.file"), log_level=config_store.get("log.level")
     )
 
-    threads = []
+    # Create every ice cube before starting any of them so that all log
+    # subscribers are registered before the shared tailer replays its backlog
     for ice_cube_name in MODULES:
         try:
-            thread, instance = start_ice_cube_thread(ice_cube_name)
-            threads.append(thread)
-            instances.append(instance)
+            instances.append(create_ice_cube(ice_cube_name))
+        except Exception as e:
+            logger.error(f"Failed to create ice cube {ice_cube_name}: {e}")
+            sys.exit(1)
+
+    threads = []
+    for ice_cube_name, instance in zip(MODULES, instances):
+        try:
+            threads.append(start_ice_cube_thread(ice_cube_name, instance))
         except Exception as e:
             logger.error(f"Failed to start thread for ice cube {ice_cube_name}: {e}")
             sys.exit(1)
@@ -128,6 +140,10 @@ def main() -> None:
         except Exception as e:
             logger.error(f"Error joining thread: {e}")
 
+    logger.info("Delivering queued alerts...")
+    Alerter().shutdown()
+    IcewatchClient.close_spool()
+
     logger.info("Icebox stopped")
 
 
@@ -1,13 +1,23 @@
+import heapq
 import socket
 import time
 import random
 import threading
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.alerter import Alerter
 from modules.logger import Logger
 from modules.config_store import ConfigStore
+from modules.result_store import ResultStore
+
+DEFAULT_MAX_IN_FLIGHT = 32
+DEFAULT_TIMEOUT = 5
+DEFAULT_INTERVAL = 75
+DEFAULT_JITTER = 15
+# Upper bound on how long the scheduler sleeps before checking for shutdown
+MAX_IDLE_WAIT = 1.0
 
 
 class Icepick:
@@ -23,9 +33,15 @@ class Icepick:
         if not Icepick._initialized:
             self.config_store = ConfigStore()
             self.shutdown_flag = shutdown_flag or threading.Event()
-            self._results_lock = threading.Lock()
-            self.latest_results = []
+            self.results = ResultStore()
             self.connections = []
+            # key -> (connection, generation); heap of (due, generation, key).
+            # Heap entries whose generation no longer matches are stale.
+            self._schedule = {}
+            self._due = []
+            self._generation = 0
+            self._in_flight = set()
+            self._schedule_changed = threading.Condition()
 
             self.icebox_name = self.config_store.get("icebox.name")
             self.logger = Logger.get_logger("icepick")
@@ -45,49 +61,154 @@ class Icepick:
     def stop(self) -> None:
         self.logger.info("Stopping icepick")
         self.shutdown_flag.set()
+        with self._schedule_changed:
+            self._schedule_changed.notify_all()
 
     def set_connections(self, connections: list) -> None:
-        """Update the list of connections to monitor."""
-        self.connections = connections
+        """Update the list of connections to monitor.
+
+        Only rules that were added or whose settings changed are
+        rescheduled. New rules are spread evenly over their interval so that
+        a large config does not probe everything at once.
+        """
+        now = time.monotonic()
+        with self._schedule_changed:
+            schedule = {}
+            new_rules = []
+            for connection in connections:
+                key = self._rule_key(connection)
+                current = self._schedule.get(key)
+                if current is not None and current[0] == connection:
+                    schedule[key] = current
+                else:
+                    new_rules.append((key, connection))
+
+            for index, (key, connection) in enumerate(new_rules):
+                self._generation += 1
+                schedule[key] = (connection, self._generation)
+                offset = self._interval(connection) * index / len(new_rules)
+                heapq.heappush(self._due, (now + offset, self._generation, key))
+
+            self._schedule = schedule
+            self.connections = connections
+            self.results.retain(
+                connection["id"] for connection in connections if "id" in connection
+            )
+            # Drop stale entries so removed rules do not pile up in the heap
+            if len(self._due) > 2 * len(schedule) + 16:
+                self._due = [
+                    entry
+                    for entry in self._due
+                    if entry[2] in schedule and schedule[entry[2]][1] == entry[1]
+                ]
+                heapq.heapify(self._due)
+            self._schedule_changed.notify_all()
+
+    @staticmethod
+    def _rule_key(connection: dict) -> str:
+        return str(connection.get("id", connection.get("name")))
+
+    @staticmethod
+    def _interval(connection: dict) -> float:
+        return float(connection.get("interval", DEFAULT_INTERVAL))
+
+    def _next_due(self, connection: dict, due: float, now: float) -> float:
+        interval = self._interval(connection)
+        jitter = min(float(connection.get("jitter", DEFAULT_JITTER)), interval / 2)
+        # Schedule from the previous due time so rules do not drift, unless
+        # the scheduler has fallen more than a whole interval behind
+        base = due if now - due < interval else now
+        return base + interval + random.uniform(-jitter, jitter)
+
+    def _pop_due(self, now: float) -> list:
+        """Remove and return the connections that are due, rescheduling them."""
+        due_connections = []
+        while self._due and self._due[0][0] <= now:
+            due, generation, key = heapq.heappop(self._due)
+            current = self._schedule.get(key)
+            if current is None or current[1] != generation:
+                continue
+            connection = current[0]
+            heapq.heappush(
+                self._due, (self._next_due(connection, due, now), generation, key)
+            )
+            if key in self._in_flight:
+                self.logger.warning(
+                    f"Skipping {connection.get('name')}: previous probe still running"
+                )
+                continue
+            self._in_flight.add(key)
+            due_connections.append((key, connection))
+        return due_connections
 
     def run(self) -> None:
+        """Probe each connection when it is due, until stopped.
+
+        Most rules are expected to be blackholed, so probes spend nearly all
+        of their time waiting for the timeout. Up to max_in_flight of them
+        run side by side so that one slow probe does not hold up the rest.
+        """
         self.logger.info("Starting icepick")
-        while not self.shutdown_flag.is_set():
-            results = []
-            for connection in self.connections:
-                result = self.process_connection(connection)
-                if result:
-                    results.append(result)
-            with self._results_lock:
-                self.latest_results += results
-            time.sleep(random.randint(60, 90))
+        max_in_flight = self.config_store.get(
+            "icepick_settings.max_in_flight", DEFAULT_MAX_IN_FLIGHT
+        )
+        with ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="icepick"
+        ) as executor:
+            while not self.shutdown_flag.is_set():
+                with self._schedule_changed:
+                    now = time.monotonic()
+                    due_connections = self._pop_due(now)
+                    if not due_connections:
+                        wait = MAX_IDLE_WAIT
+                        if self._due:
+                            wait = min(self._due[0][0] - now, MAX_IDLE_WAIT)
+                        self._schedule_changed.wait(max(wait, 0))
+                        continue
+
+                for key, connection in due_connections:
+                    executor.submit(self._probe, key, connection)
+
+    def _probe(self, key: str, connection: dict) -> None:
+        try:
+            self.process_connection(connection)
+        except Exception as e:
+            self.logger.error(f"Error processing {connection.get('name')}: {e}")
+        finally:
+            with self._schedule_changed:
+                self._in_flight.discard(key)
 
     def check_tcp(self, host: str, port: int) -> bool:
+        timeout = self.config_store.get("icepick_settings.timeout", DEFAULT_TIMEOUT)
         try:
-            with socket.create_connection((host, port), timeout=5):
+            with socket.create_connection((host, port), timeout=timeout):
                 return True
         except Exception as e:
             return False
 
     def get_latest_results(self) -> list:
-        """Get the latest monitoring results in a thread-safe way."""
-        with self._results_lock:
-            return self.latest_results.copy()
+        """Get the results not yet delivered to Icewatch.
+
+        The list is shared and must not be modified.
+        """
+        return self.results.snapshot()[1]
 
     def process_connection(self, connection: dict) -> dict:
         failure_action = connection["failure_action"]
         success_action = connection["success_action"]
+        start = time.monotonic()
         connection_status = self.check_tcp(
             host=connection["host"], port=connection["port"]
         )
+        latency = time.monotonic() - start
 
         status = "success" if connection_status else "failure"
-        result = {
-            "ruleId": connection["id"],
-            "timestamp": time.time(),
-            "result": status,
-        }
-        self.latest_results.append(result)
+        result = self.results.record(
+            rule_id=connection["id"],
+            status=status,
+            latency=latency,
+            timestamp=time.time(),
+        )
 
         result_text = "succeeded" if connection_status else "failed"
         subject = f"{self.icebox_name}: {connection['name']}: Connection {result_text.upper()}"
@@ -102,7 +223,9 @@ class Icepick:
         if action == "pass":
             self.logger.info(f"Passing for {connection['name']}")
         elif action == "alert":
-            self.alerter.alert(source="icepick", subject=subject, body=body)
+            self.alerter.alert(
+                source="icepick", subject=subject, body=body, key=str(connection["id"])
+            )
         else:
             message = f"Unknown action for {connection['name']}: {action}, connection {result}"
             self.logger.error(message)
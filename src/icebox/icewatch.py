@@ -1,6 +1,6 @@
+import gzip
 import json
-import hashlib
-import queue
+import os
 import time
 import threading
 import requests
@@ -12,15 +12,28 @@ from icepick import Icepick
 from modules.config_store import ConfigStore
 from modules.logger import Logger
 from modules.alerter import Alert
+from modules.spool import AlertSpool
 from modules.utils import get_raw_http
 
 ALERT_ENDPOINT = "alert"
+# Request bodies at least this large are sent gzip-encoded
+GZIP_THRESHOLD = 1024
+REQUEST_TIMEOUT = 30
+DEFAULT_SPOOL_PATH = "/opt/icebox/icewatch_spool.sqlite"
+# Kept with the other state the service writes, as /etc/icebox belongs to root
+CACHED_CONFIG_PATH = "/opt/icebox/config-icewatch.json"
+ALERT_BATCH_SIZE = 100
+# How many batches one send_alerts() call may send when there is a backlog
+MAX_BATCHES_PER_FLUSH = 50
+CHECK_IN_INTERVAL = 60
+ALERT_INTERVAL = 10
+# Spool depth at which alerts are flushed without waiting for ALERT_INTERVAL
+FLUSH_THRESHOLD = ALERT_BATCH_SIZE
 
 
 class IcewatchClient:
     _instance = None
     _lock = threading.Lock()
-    _alert_queue = queue.Queue()
 
     def __new__(cls, *args, **kwargs):
         with cls._lock:
@@ -34,6 +47,7 @@ class IcewatchClient:
         api_url: str = None,
         api_key: str = None,
         config_store: Optional[ConfigStore] = None,
+        spool_path: str = DEFAULT_SPOOL_PATH,
     ):
         """Initialize Icewatch client."""
         if self.initialized:
@@ -45,11 +59,23 @@ class IcewatchClient:
         self.api_url = api_url.rstrip("/")
         self.api_key = api_key
         self.error_count = 0
+        # Both loop threads count their errors
+        self._error_lock = threading.Lock()
         self.default_config_path = Path("/etc/icebox/config.json")
-        self.cached_config_path = Path("/etc/icebox/config-icewatch.json")
+        self.cached_config_path = Path(CACHED_CONFIG_PATH)
         self.logger = Logger.get_logger("icewatch")
         self.initial_config_event = threading.Event()
-        self.alert_queue = self._alert_queue
+        self.spool = AlertSpool(spool_path)
+        self._flush_requested = threading.Event()
+        self._resync_config = False
+
+        # One keep-alive session so check-ins and alert batches reuse the
+        # same TLS connection instead of handshaking every time
+        self.session = requests.Session()
+        self.session.headers.update(
+            {"x-api-key": self.api_key, "Content-Type": "application/json"}
+        )
+        self.request_count = 0
 
         self.logger.info("Setting up configuration store")
         self.config_store = config_store or ConfigStore()
@@ -76,7 +102,7 @@ class IcewatchClient:
     def queue_alert(
         cls, source: str, subject: str, body: str, idempotency_token: str
     ) -> bool:
-        """Queue an alert for sending to Icewatch.
+        """Spool an alert for sending to Icewatch.
 
         Args:
             source: The source/module generating the alert
@@ -85,8 +111,11 @@ class IcewatchClient:
             idempotency_token: A unique ID
 
         Returns:
-            bool: True if alert was queued successfully
+            bool: True if alert was spooled successfully
         """
+        instance = cls._instance
+        if instance is None or not instance.initialized:
+            return False
         try:
             alert = Alert(
                 source=source,
@@ -95,55 +124,63 @@ class IcewatchClient:
                 timestamp=time.time(),
                 idempotency_token=idempotency_token,
             )
-            cls._alert_queue.put(alert)
+            instance.spool.append(alert)
+            if len(instance.spool) >= FLUSH_THRESHOLD:
+                instance._flush_requested.set()
             return True
-        except Exception:
+        except Exception as e:
+            instance.logger.error(f"Failed to spool alert: {e}")
             return False
 
-    def _get_queued_alerts(self, max_alerts: int = 100) -> list[Alert]:
-        """Get queued alerts for processing."""
-        alerts = []
-        try:
-            while len(alerts) < max_alerts and not self._alert_queue.empty():
-                alerts.append(self._alert_queue.get_nowait())
-        except queue.Empty:
-            pass
-        return alerts
-
-    def _read_config(self) -> Optional[dict]:
-        """Read and parse local config file.
-
-        Returns config from either disk or the config store."""
-        try:
-            return self.config_store.get_config()
-        except (KeyError, TypeError):
-            pass
-
-        try:
-            if self.cached_config_path.exists():
-                with open(self.cached_config_path) as f:
-                    return json.load(f)
-            if self.default_config_path.exists():
-                with open(self.default_config_path) as f:
-                    return json.load(f)
-            return None
-        except json.JSONDecodeError:
-            return None
+    @classmethod
+    def close_spool(cls) -> None:
+        """Close the alert spool, once nothing will queue alerts any more."""
+        instance = cls._instance
+        if instance is not None and instance.initialized:
+            instance.spool.close()
 
     def _write_config(self, config: dict) -> None:
-        """Write config to cache file and update global store."""
-        with open(self.cached_config_path, "w") as f:
+        """Write config to cache file atomically."""
+        temp_path = self.cached_config_path.with_name(
+            f".{self.cached_config_path.name}.tmp"
+        )
+        with open(temp_path, "w") as f:
             json.dump(config, f, indent=2)
-        self.config_store.update_config(config)
-        self.initial_config_event.set()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.cached_config_path)
+
+    def _apply_config_response(self, response_data: dict) -> None:
+        """Apply a full config or a config patch from a check-in response."""
+        version = self.config_store.version
+        if "config" in response_data:
+            self.config_store.update_config(response_data["config"])
+        elif "configPatch" in response_data:
+            try:
+                self.config_store.apply_patch(
+                    response_data["configPatch"],
+                    expected_hash=response_data.get("configHash"),
+                )
+            except ValueError as e:
+                # Ask for the full config on the next check-in
+                self.logger.warning(f"Could not apply config patch: {e}")
+                self._resync_config = True
+                return
+        else:
+            self.initial_config_event.set()
+            return
 
-    def _get_config_hash(self, config: Optional[dict]) -> str:
-        """Generate SHA-256 hash of config JSON string."""
-        if config is None:
-            return ""
-        config_str = json.dumps(config, separators=(",", ":"))
-        config_hash = hashlib.sha256(config_str.encode("utf-8")).hexdigest()
-        return config_hash
+        self._resync_config = False
+        if (
+            self.config_store.version != version
+            or not self.cached_config_path.exists()
+        ):
+            try:
+                self._write_config(self.config_store.get_config())
+            except OSError as e:
+                # The config is applied, it just will not survive a restart
+                self.logger.error(f"Failed to cache Icewatch config: {e}")
+        self.initial_config_event.set()
 
     def _load_cached_config(self) -> bool:
         """Load config from cache file."""
@@ -190,60 +227,79 @@ class IcewatchClient:
     ) -> dict:
         """Make an API request to the Icebox server."""
 
-        request_headers = {
-            "x-api-key": self.api_key,
-            "Content-Type": "application/json",
-        }
-
-        if headers:
-            request_headers.update(headers)
+        request_headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+            if len(body) >= GZIP_THRESHOLD:
+                body = gzip.compress(body)
+                request_headers["Content-Encoding"] = "gzip"
 
-        response = requests.request(
+        response = self.session.request(
             method=method,
             url=f"{self.api_url}/{endpoint}",
             headers=request_headers,
-            json=data,
-            timeout=30,
+            data=body,
+            timeout=REQUEST_TIMEOUT,
         )
+        self.request_count += 1
 
         if self.logger.isEnabledFor(logging.DEBUG):
             raw_request, raw_response = get_raw_http(response)
+            stats = self.get_connection_stats()
             self.logger.debug(
                 f"\nHTTP Request:\n{raw_request}\n\n" f"HTTP Response:\n{raw_response}"
             )
+            self.logger.debug(
+                f"HTTP connections opened: {stats['connections_opened']} "
+                f"for {stats['requests']} requests"
+            )
 
         return response
 
+    def get_connection_stats(self) -> dict:
+        """Return how many connections the session opened for its requests."""
+        connections_opened = 0
+        for adapter in self.session.adapters.values():
+            for key in adapter.poolmanager.pools.keys():
+                connections_opened += adapter.poolmanager.pools[key].num_connections
+        return {
+            "requests": self.request_count,
+            "connections_opened": connections_opened,
+        }
+
     def check_in(self) -> bool:
         """Perform check-in with Icebox server.
 
         Returns:
             bool: True if check-in was successful
         """
-        current_config = self._read_config()
-        config_hash = self._get_config_hash(current_config)
+        config_hash = "" if self._resync_config else self.config_store.config_hash
 
-        icepick_results = self.icepick.get_latest_results()
+        results_sequence, icepick_results = self.icepick.results.snapshot()
         data = {
             "configHash": config_hash,
             "icepickResults": icepick_results,
         }
+        headers = {"If-None-Match": f'"{config_hash}"'} if config_hash else None
 
         try:
             response = self._make_api_request(
                 endpoint="check-in",
                 method="POST",
                 data=data,
+                headers=headers,
             )
 
-            if response.status_code == 200:
-                response_data = response.json()
-
-                if "config" in response_data:
-                    new_config = response_data["config"]
-                    self._write_config(new_config)
+            if response.status_code == 304:
+                # Our config is current and Icewatch has nothing else for us
+                self.initial_config_event.set()
+                self.icepick.results.acknowledge(results_sequence)
+                return True
 
-                self.icepick.latest_results.clear()
+            if response.status_code == 200:
+                self._apply_config_response(response.json())
+                self.icepick.results.acknowledge(results_sequence)
 
                 return True
 
@@ -266,59 +322,102 @@ class IcewatchClient:
         return False
 
     def send_alerts(self) -> bool:
-        """Send queued alerts to Icewatch server."""
-        alerts = self._get_queued_alerts(max_alerts=100)
-        if not alerts:
-            return True
-
-        data = self._format_alerts_data(alerts)
+        """Send spooled alerts to Icewatch in order, oldest first.
 
-        try:
-            response = self._make_api_request(
-                endpoint=ALERT_ENDPOINT, method="POST", data=data
-            )
+        Sends batch after batch while a backlog remains, up to
+        MAX_BATCHES_PER_FLUSH. A failed batch stays in the spool and is
+        retried first next time.
 
-            if response.status_code == 200:
-                self.logger.info(f"Successfully sent {len(alerts)} alerts")
+        Returns:
+            bool: True if every batch sent was accepted
+        """
+        for _ in range(MAX_BATCHES_PER_FLUSH):
+            batch = self.spool.peek(ALERT_BATCH_SIZE)
+            if not batch:
                 return True
-            else:
+
+            alerts = [alert for _, alert in batch]
+            data = self._format_alerts_data(alerts)
+
+            try:
+                response = self._make_api_request(
+                    endpoint=ALERT_ENDPOINT, method="POST", data=data
+                )
+            except requests.RequestException as e:
+                self.logger.error(f"Network error sending alerts: {e}")
+                return False
+
+            if response.status_code != 200:
                 self.logger.error(f"Failed to send alerts: {response.status_code}")
-                for alert in alerts:
-                    self._alert_queue.put(alert)
                 return False
 
-        except requests.RequestException as e:
-            self.logger.error(f"Network error sending alerts: {e}")
-            for alert in alerts:
-                self._alert_queue.put(alert)
-            return False
+            self.spool.acknowledge(batch[-1][0])
+            self.logger.info(f"Successfully sent {len(alerts)} alerts")
+            if len(batch) < ALERT_BATCH_SIZE:
+                return True
+        return True
 
     def run(self) -> None:
-        """Run the Icewatch client loop."""
-        self.logger.info("Starting Icewatch client")
-        last_alert_time = 0
-        last_check_in_time = 0
+        """Run check-ins and alert flushes on their own threads.
 
+        A check-in that hangs until its timeout no longer holds up alert
+        delivery, and a failed check-in no longer skips a flush. The session
+        is closed once both loops have stopped. The spool is left open, as
+        alerts raised during shutdown are still spooled; see close_spool().
+        """
+        self.logger.info("Starting Icewatch client")
+        loops = [
+            threading.Thread(
+                target=self._run_every,
+                args=(CHECK_IN_INTERVAL, self.check_in, None),
+                name="icewatch-check-in",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._run_every,
+                args=(ALERT_INTERVAL, self.send_alerts, self._flush_requested),
+                name="icewatch-alerts",
+                daemon=True,
+            ),
+        ]
+        for loop in loops:
+            loop.start()
+
+        self.shutdown_flag.wait()
+        self._flush_requested.set()
+        for loop in loops:
+            loop.join(REQUEST_TIMEOUT)
+            if loop.is_alive():
+                self.logger.warning(f"{loop.name} did not stop in time")
+
+        self.session.close()
+
+    def _run_every(
+        self, interval: float, task, wake: Optional[threading.Event]
+    ) -> None:
+        """Run task every interval seconds, or as soon as wake is set."""
         while not self.shutdown_flag.is_set():
             try:
-                current_time = time.time()
-
-                if current_time - last_check_in_time >= 60:
-                    last_check_in_time = current_time
-                    self.check_in()
-
-                if current_time - last_alert_time >= 10:
-                    last_alert_time = current_time
-                    self.send_alerts()
-
+                succeeded = task()
             except Exception as e:
-                self.error_count += 1
+                succeeded = False
+                with self._error_lock:
+                    self.error_count += 1
+                    error_count = self.error_count
                 self.logger.error(f"Error in Icewatch loop: {e}")
-                self.logger.error(f"Error count: {self.error_count}")
+                self.logger.error(f"Error count: {error_count}")
 
-            time.sleep(1)
+            if wake is None or not succeeded:
+                # Back off for a full interval after a failure, so a backlog
+                # does not retry an unreachable server in a tight loop
+                self.shutdown_flag.wait(interval)
+            else:
+                wake.wait(interval)
+            if wake is not None:
+                wake.clear()
 
     def stop(self) -> None:
         """Stop the Icewatch client."""
         self.logger.info("Stopping Icewatch client")
         self.shutdown_flag.set()
+        self._flush_requested.set()
@@ -1,11 +1,26 @@
-from datetime import datetime, timedelta, timezone
 import threading
-import re
 
 from modules.alerter import Alerter
 from modules.logger import Logger
 from modules.log_watcher import LogWatcher
 from modules.config_store import ConfigStore
+from modules.connection_tracker import (
+    PORT_SCAN,
+    ConnectionTracker,
+    FloodReport,
+    ScanReport,
+)
+from modules.packet import PacketRecord
+
+# Alerts list at most this many of the ports a source connected to
+MAX_LISTED_PORTS = 100
+
+FILTERED_ICMP_TYPES = {
+    0,  # Echo Reply
+    3,  # Destination Unreachable - due to Icepick checks
+    4,  # Source Quench
+    11,  # Time Exceeded
+}
 
 
 class Icicle:
@@ -17,6 +32,7 @@ class Icicle:
 
         self.config_store.watch("iptables.log_file", self._handle_log_file_change)
         self.config_store.watch("smtp", self._handle_smtp_config_change)
+        self.config_store.watch("icicle", self._handle_icicle_config_change)
 
         self.icebox_name = self.config_store.get("icebox.name")
         self.iptables_log = self.config_store.get("iptables.log_file")
@@ -24,7 +40,9 @@ class Icicle:
         if self.config_store.get("smtp"):
             self.alerter.configure_smtp(self.config_store.get("smtp"))
 
-        self.connection_tracker = {}
+        self.connection_tracker = ConnectionTracker(
+            config=self.config_store.get("icicle")
+        )
         self.new_message_event = threading.Event()
 
         self.log_watcher = LogWatcher(
@@ -46,9 +64,17 @@ class Icicle:
             self.logger.info(f"Updating SMTP configuration")
             self.alerter.configure_smtp(new_config)
 
+    def _handle_icicle_config_change(self, new_config: dict) -> None:
+        """Apply new scan detection settings."""
+        try:
+            self.connection_tracker.configure(new_config)
+        except (AttributeError, TypeError, ValueError) as e:
+            self.logger.error(f"Invalid icicle config, keeping the old one: {e}")
+
     def stop(self) -> None:
         self.logger.info("Stopping icicle")
         self.shutdown_flag.set()
+        self.new_message_event.set()
         if hasattr(self, "log_watcher"):
             self.log_watcher.stop()
 
@@ -57,65 +83,62 @@ class Icicle:
         self.log_watcher.start()
 
         while not self.shutdown_flag.is_set():
-            now = datetime.now(timezone.utc)
-            for src_address in list(self.connection_tracker.keys()):
-                connection_info = self.connection_tracker[src_address]
-                time_since = now - connection_info["first_connection"]
-                if time_since > timedelta(seconds=1):
-                    del self.connection_tracker[src_address]
-                    self.send_alert(src_address, connection_info)
-
-            self.new_message_event.wait(timeout=1)
             self.new_message_event.clear()
+            for report in self.connection_tracker.due_reports():
+                if isinstance(report, FloodReport):
+                    self.send_flood_alert(report)
+                else:
+                    self.send_alert(report)
+
+            # Sleep until the next report is due, or until a connection
+            # arrives when none are pending
+            self.new_message_event.wait(
+                self.connection_tracker.time_until_next_deadline()
+            )
 
     def handle_message(self, message: str) -> None:
         try:
-            proto = re.search(r"PROTO=([0-9A-Za-z]*)", message)[1]
-            if proto == "ICMP":
-                message += " DPT=0"
-
-                type = int(re.search(r"PROTO=ICMP TYPE=([0-9]*)", message)[1])
-                filtered_types = [
-                    0,  # Echo Reply
-                    3,  # Destination Unreachable - due to Icepick checks
-                    4,  # Source Quench
-                    11,  # Time Exceeded
-                ]
-                if type in filtered_types:
+            packet = PacketRecord(message)
+            if packet.proto == "ICMP":
+                if packet.icmp_type in FILTERED_ICMP_TYPES:
                     return
+                dest_port = 0
+            else:
+                dest_port = packet.dpt
 
-            self.logger.info(f"Detected incoming connection: {message}")
-            src_address = re.search(r"SRC=([0-9A-Fa-f:\.]*)", message)[1]
-            dest_port = int(re.search(r"DPT=([0-9]*)", message)[1])
-            if src_address in self.connection_tracker:
-                self.connection_tracker[src_address]["connected_ports"].append(
-                    dest_port
-                )
+            if packet.src is None or dest_port is None:
+                raise ValueError("missing SRC or DPT field")
+
+            if self.connection_tracker.flooding:
+                # Logging every packet of a flood would flood the disk too
+                self.logger.debug(f"Detected incoming connection: {message}")
             else:
-                self.connection_tracker[src_address] = {
-                    "connected_ports": [dest_port],
-                    "first_connection": datetime.now(timezone.utc),
-                }
-            self.new_message_event.set()
+                self.logger.info(f"Detected incoming connection: {message}")
+            if self.connection_tracker.record(packet.src, packet.proto, dest_port):
+                self.new_message_event.set()
         except Exception as e:
             self.logger.error(f"Error parsing message: {e}, {message}")
 
-    def send_alert(self, src_address: str, connection_info: dict) -> None:
-        start_time = str(connection_info["first_connection"])
-        ports = connection_info["connected_ports"]
-        num_ports = len(ports)
-        unique_ports = sorted(set(ports))
-        num_unique_ports = len(unique_ports)
+    def send_alert(self, report: ScanReport) -> None:
+        start_time = str(report.started)
+        src_address = report.src_address
+        num_ports = report.connections
+        num_unique_ports = len(report.ports)
 
-        subject = f"{self.icebox_name}: CONNECTION DETECTED"
-        if num_unique_ports > 3:
-            subject = f"{self.icebox_name}: PORT SCAN DETECTED"
-        elif num_unique_ports == 1 and 0 in unique_ports:
-            subject = f"{self.icebox_name}: PING DETECTED"
+        subject = f"{self.icebox_name}: {report.classification} DETECTED"
 
         connected_ports = ""
-        for port in unique_ports:
+        for port in report.ports[:MAX_LISTED_PORTS]:
             connected_ports += f" - {port}\n"
+        if num_unique_ports > MAX_LISTED_PORTS:
+            connected_ports += f" - and {num_unique_ports - MAX_LISTED_PORTS} more\n"
+
+        detection = ""
+        if report.classification == PORT_SCAN:
+            detection = (
+                f"The scan threshold was reached within a {report.scan_window} "
+                f"window.\n\n"
+            )
 
         self.alerter.alert(
             source="icicle",
@@ -124,7 +147,33 @@ class Icicle:
                 f"Icebox {self.icebox_name} detected an incoming connection from {src_address}.\n\n"
                 f"{num_ports} connections were observed to "
                 f"{num_unique_ports} unique ports, starting at {start_time}.\n\n"
+                f"{detection}"
                 f"Ports connected to:\n"
                 f"{connected_ports}"
             ),
+            key=src_address,
+        )
+
+    def send_flood_alert(self, report: FloodReport) -> None:
+        top_sources = ""
+        for address, connections, ports in report.top_sources:
+            top_sources += (
+                f" - {address}: about {connections} connections "
+                f"to about {ports} ports\n"
+            )
+
+        self.alerter.alert(
+            source="icicle",
+            subject=f"{self.icebox_name}: FLOOD IN PROGRESS",
+            body=(
+                f"Icebox {self.icebox_name} is receiving connections from too many "
+                f"sources to track them individually.\n\n"
+                f"About {report.connections} connections from about "
+                f"{report.sources} sources have been observed since "
+                f"{report.started}. Individual connection alerts are paused "
+                f"until the flood subsides.\n\n"
+                f"Busiest sources:\n"
+                f"{top_sources}"
+            ),
+            key="flood",
         )
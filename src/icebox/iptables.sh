@@ -7,17 +7,24 @@ add_rules() {
         DEVICE_IP=$(ip route get 1 | awk '{print $7; exit}')
     fi
 
+    # Log to kern.log by default, or to a netlink group with EVENT_SOURCE=nflog
+    if [ "$EVENT_SOURCE" = "nflog" ]; then
+        LOG_TARGET=(-j NFLOG --nflog-group "${NFLOG_GROUP:-5}" --nflog-prefix)
+    else
+        LOG_TARGET=(-j LOG --log-prefix)
+    fi
+
     # ICICLE
     # Add logging rules for new TCP, UDP, and ICMP traffic to device IP
-    iptables -A INPUT -d $DEVICE_IP -p tcp -m conntrack --ctstate NEW -j LOG --log-prefix "ICICLE: "
-    iptables -A INPUT -d $DEVICE_IP -p udp -m conntrack --ctstate NEW -j LOG --log-prefix "ICICLE: "
-    iptables -A INPUT -d $DEVICE_IP -p icmp -j LOG --log-prefix "ICICLE: "
+    iptables -A INPUT -d $DEVICE_IP -p tcp -m conntrack --ctstate NEW "${LOG_TARGET[@]}" "ICICLE: "
+    iptables -A INPUT -d $DEVICE_IP -p udp -m conntrack --ctstate NEW "${LOG_TARGET[@]}" "ICICLE: "
+    iptables -A INPUT -d $DEVICE_IP -p icmp "${LOG_TARGET[@]}" "ICICLE: "
 
     # SNOWDOG
     # Add logging rules for broadcast, multicast, and anycast traffic
-    iptables -A INPUT -m addrtype --dst-type BROADCAST -j LOG --log-prefix "SNOWDOG: "
-    iptables -A INPUT -m addrtype --dst-type MULTICAST -j LOG --log-prefix "SNOWDOG: "
-    iptables -A INPUT -m addrtype --dst-type ANYCAST -j LOG --log-prefix "SNOWDOG: "
+    iptables -A INPUT -m addrtype --dst-type BROADCAST "${LOG_TARGET[@]}" "SNOWDOG: "
+    iptables -A INPUT -m addrtype --dst-type MULTICAST "${LOG_TARGET[@]}" "SNOWDOG: "
+    iptables -A INPUT -m addrtype --dst-type ANYCAST "${LOG_TARGET[@]}" "SNOWDOG: "
 }
 
 remove_rules() {
@@ -0,0 +1,150 @@
+import ipaddress
+import re
+from typing import Dict, List, Optional
+
+from modules.logger import Logger
+from modules.mac import parse_mac
+
+# Candidate addresses; anything that does not parse is ignored. IPv4 is
+# matched exactly so trailing punctuation and ":port" suffixes are left out
+_IPV4_ADDRESS = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?!\d)")
+_IPV6_ADDRESS = re.compile(r"[0-9A-Fa-f]*:[0-9A-Fa-f:]*:[0-9A-Fa-f:.]*")
+_MAC_ADDRESS = re.compile(r"(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}")
+
+
+class FieldMatcher:
+    """Matches one alert field against any of a set of filter values.
+
+    Substring values are combined into a single alternation so a field is
+    scanned once however many filters there are. Regex values are compiled
+    on their own, since inline flags and group numbers do not survive being
+    joined into one pattern. CIDR and MAC values match when an address in
+    the field falls in the network or equals the MAC.
+    """
+
+    def __init__(self) -> None:
+        self._substrings: List[str] = []
+        self._regexes: List[re.Pattern] = []
+        self._networks: list = []
+        self._macs = set()
+        self._regex: Optional[re.Pattern] = None
+
+    def add(self, filter_type: str, value: str) -> None:
+        """Add a filter value.
+
+        Raises:
+            ValueError, re.error: If value is not valid for filter_type
+        """
+        if filter_type == "substring":
+            self._substrings.append(re.escape(value))
+        elif filter_type == "regex":
+            self._regexes.append(re.compile(value))
+        elif filter_type == "cidr":
+            self._networks.append(ipaddress.ip_network(value, strict=False))
+        elif filter_type == "mac":
+            self._macs.add(parse_mac(value))
+        else:
+            raise ValueError(f"unknown filter type: {filter_type!r}")
+        self._regex = None
+
+    def compile(self) -> "FieldMatcher":
+        if self._substrings:
+            self._regex = re.compile("|".join(self._substrings))
+        return self
+
+    def __bool__(self) -> bool:
+        return bool(
+            self._substrings or self._regexes or self._networks or self._macs
+        )
+
+    def matches(self, text: str) -> bool:
+        if self._regex is not None and self._regex.search(text):
+            return True
+        if any(regex.search(text) for regex in self._regexes):
+            return True
+        if self._networks:
+            candidates = _IPV4_ADDRESS.findall(text) + [
+                candidate.rstrip(".:") for candidate in _IPV6_ADDRESS.findall(text)
+            ]
+            for candidate in candidates:
+                try:
+                    address = ipaddress.ip_address(candidate)
+                except ValueError:
+                    continue
+                if any(address in network for network in self._networks):
+                    return True
+        if self._macs:
+            for candidate in _MAC_ADDRESS.findall(text):
+                if parse_mac(candidate) in self._macs:
+                    return True
+        return False
+
+
+class SourceFilters:
+    """The compiled filters for one alert source."""
+
+    def __init__(self) -> None:
+        # Filters that only set one of subject or body
+        self.subject = FieldMatcher()
+        self.body = FieldMatcher()
+        # Filters that set both, which must match together
+        self.pairs: List[tuple] = []
+
+    def matches(self, subject: str, body: str) -> bool:
+        if self.subject and self.subject.matches(subject):
+            return True
+        if self.body and self.body.matches(body):
+            return True
+        return any(
+            subject_matcher.matches(subject) and body_matcher.matches(body)
+            for subject_matcher, body_matcher in self.pairs
+        )
+
+
+class AlertFilterIndex:
+    """The alert_filters config, compiled for fast matching.
+
+    Filters are grouped by source, so checking an alert is one dict lookup
+    plus one scan of its subject and one of its body.
+    """
+
+    def __init__(self, filters: Optional[list] = None) -> None:
+        self.logger = Logger.get_logger("alerter")
+        self._sources: Dict[str, SourceFilters] = {}
+        for alert_filter in filters or []:
+            try:
+                self._add(alert_filter)
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                self.logger.error(f"Ignoring invalid alert filter {alert_filter}: {e}")
+        for source_filters in self._sources.values():
+            source_filters.subject.compile()
+            source_filters.body.compile()
+
+    def _add(self, alert_filter: dict) -> None:
+        filter_type = alert_filter.get("type", "substring")
+        subject = alert_filter.get("subject")
+        body = alert_filter.get("body")
+        if not subject and not body:
+            return
+
+        source_filters = self._sources.get(alert_filter["source"])
+        if source_filters is None:
+            source_filters = SourceFilters()
+
+        if subject and body:
+            subject_matcher, body_matcher = FieldMatcher(), FieldMatcher()
+            subject_matcher.add(filter_type, subject)
+            body_matcher.add(filter_type, body)
+            source_filters.pairs.append(
+                (subject_matcher.compile(), body_matcher.compile())
+            )
+        elif subject:
+            source_filters.subject.add(filter_type, subject)
+        else:
+            source_filters.body.add(filter_type, body)
+        self._sources[alert_filter["source"]] = source_filters
+
+    def matches(self, source: str, subject: str, body: str) -> bool:
+        """Return True if the alert should be filtered out."""
+        source_filters = self._sources.get(source)
+        return source_filters is not None and source_filters.matches(subject, body)
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+DEFAULT_BURST = 3
+DEFAULT_PER_MINUTE = 0.2
+DEFAULT_COALESCE_WINDOW = 0.0
+# Least recently seen keys are forgotten beyond this many
+MAX_KEYS = 4096
+
+
+class AlertBucket:
+    """Token bucket and suppression count for one alert key."""
+
+    __slots__ = (
+        "tokens",
+        "updated",
+        "last_emitted",
+        "suppressed",
+        "first_suppressed",
+    )
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated = now
+        self.last_emitted = None
+        self.suppressed = 0
+        self.first_suppressed = None
+
+
+class AlertLimiter:
+    """Rate limits and coalesces alerts per (source, subject, key).
+
+    Each key has a token bucket holding up to `burst` alerts, refilled at
+    `per_minute`. An alert within `coalesce_window` seconds of the last one
+    emitted for its key is also held back. Suppressed alerts are counted,
+    and the count is reported with the next alert that gets through.
+    """
+
+    def __init__(self, config: Optional[dict] = None) -> None:
+        config = config or {}
+        self.burst = float(config.get("burst", DEFAULT_BURST))
+        self.per_minute = float(config.get("per_minute", DEFAULT_PER_MINUTE))
+        self.coalesce_window = float(
+            config.get("coalesce_window", DEFAULT_COALESCE_WINDOW)
+        )
+        self._buckets: "OrderedDict[Hashable, AlertBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: Hashable, now: Optional[float] = None) -> Tuple[bool, str]:
+        """Decide whether an alert for key may be sent.
+
+        Returns:
+            Tuple[bool, str]: Whether to send the alert, and a note on the
+                alerts suppressed since the last one sent, or ""
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = AlertBucket(self.burst, now)
+                if len(self._buckets) > MAX_KEYS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(
+                    self.burst,
+                    bucket.tokens + (now - bucket.updated) * self.per_minute / 60,
+                )
+                bucket.updated = now
+
+            coalescing = (
+                bucket.last_emitted is not None
+                and now - bucket.last_emitted < self.coalesce_window
+            )
+            if coalescing or bucket.tokens < 1:
+                if not bucket.suppressed:
+                    bucket.first_suppressed = time.time()
+                bucket.suppressed += 1
+                return False, ""
+
+            bucket.tokens -= 1
+            bucket.last_emitted = now
+            note = ""
+            if bucket.suppressed:
+                since = time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.localtime(bucket.first_suppressed)
+                )
+                note = (
+                    f"{bucket.suppressed} similar alerts were suppressed "
+                    f"since {since}."
+                )
+                bucket.suppressed = 0
+            return True, note
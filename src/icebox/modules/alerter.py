@@ -1,16 +1,21 @@
-import socket
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Optional, Any
 import threading
-from queue import Queue
+from queue import Empty, Full, Queue
 import time
 from dataclasses import dataclass
 from uuid import uuid4
 
 from modules.logger import Logger
 from modules.config_store import ConfigStore
+from modules.alert_filters import AlertFilterIndex
+from modules.alert_limiter import AlertLimiter
+from modules.smtp_session import SmtpSession
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_SHUTDOWN_TIMEOUT = 10.0
+DEFAULT_SMTP_IDLE_TIMEOUT = 60.0
 
 
 @dataclass
@@ -34,41 +39,72 @@ class Alerter:
                 cls._instance = super(Alerter, cls).__new__(cls)
                 cls._instance.logger = Logger.get_logger("alerter")
                 cls._instance._alert_methods = {}
+                cls._instance._queues = {}
+                cls._instance._workers = {}
+                cls._instance._stats = {}
+                cls._instance._accepting = True
+                cls._instance._smtp_session = SmtpSession(DEFAULT_SMTP_IDLE_TIMEOUT)
                 cls._instance.logger.debug("Created new Alerter instance")
                 cls._instance.config_store = ConfigStore()
+                cls._instance._filters = AlertFilterIndex(
+                    cls._instance.config_store.get("alert_filters")
+                )
+                cls._instance.config_store.watch(
+                    "alert_filters", cls._instance._handle_alert_filters_change
+                )
+                cls._instance._limiter = AlertLimiter(
+                    cls._instance.config_store.get("alert_rate_limit")
+                )
+                cls._instance.config_store.watch(
+                    "alert_rate_limit", cls._instance._handle_rate_limit_change
+                )
             return cls._instance
 
-    def alert(self, source: str, subject: str, body: str) -> bool:
-        """Send an alert through all enabled methods.
+    def _handle_alert_filters_change(self, alert_filters: list) -> None:
+        """Recompile the alert filters when their config changes."""
+        self._filters = AlertFilterIndex(alert_filters)
+
+    def _handle_rate_limit_change(self, rate_limit: dict) -> None:
+        """Apply new rate limits. Suppression counts start over."""
+        self._limiter = AlertLimiter(rate_limit)
+
+    def alert(
+        self, source: str, subject: str, body: str, key: Optional[str] = None
+    ) -> bool:
+        """Queue an alert for delivery through all enabled methods.
+
+        Never blocks on delivery: each method has its own bounded queue and
+        worker thread, so a slow mail server cannot hold up the caller or the
+        other methods.
 
         Args:
             source: The source/module generating the alert
             subject: Alert subject line
             body: Alert message body
+            key: What the alert is about, e.g. an address, so that rate
+                limits apply to each one separately
 
         Returns:
-            bool: True if at least one method succeeded
+            bool: True if at least one method accepted the alert
         """
         self.logger.debug(f"Processing alert: {subject}")
         success = False
 
-        alert_filters = self.config_store.get("alert_filters")
-        if alert_filters:
-            filtered = False
-            for filter in alert_filters:
-                if filter["source"] == source:
-                    if filter["subject"] and filter["body"]:
-                        if filter["subject"] in subject and filter["body"] in body:
-                            filtered = True
-                    elif filter["subject"] and filter["subject"] in subject:
-                        filtered = True
-                    elif filter["body"] and filter["body"] in body:
-                        filtered = True
-            if filtered:
-                self.logger.debug(f"Alert filtered: {subject}")
-                return False
+        if self._filters.matches(source, subject, body):
+            self.logger.debug(f"Alert filtered: {subject}")
+            return False
+
+        allowed, note = self._limiter.check((source, subject, key))
+        if not allowed:
+            self.logger.debug(f"Alert rate limited: {subject}")
+            return False
+        if note:
+            body = f"{body}\n\n{note}"
 
         with self._lock:
+            if not self._accepting:
+                self.logger.warning(f"Alerter is shut down, dropping alert: {subject}")
+                return False
             if not self._alert_methods:
                 self.logger.warning("No alert methods configured")
                 return False
@@ -87,17 +123,143 @@ class Alerter:
                 }
 
                 try:
-                    if method == "smtp":
-                        if self._send_smtp_alert(**alert):
-                            success = True
-                    if method == "icewatch":
-                        if self._send_icewatch_alert(**alert):
-                            success = True
-                except Exception as e:
-                    self.logger.error(f"Error sending {method} alert: {e}")
+                    self._queues[method].put_nowait((time.monotonic(), alert))
+                    success = True
+                except Full:
+                    self._stats[method]["dropped"] += 1
+                    self.logger.error(f"{method} alert queue is full, dropping alert")
 
         return success
 
+    def _start_worker(self, method: str) -> None:
+        """Start the delivery thread for a transport. Call with _lock held."""
+        if method in self._workers:
+            return
+        self._queues[method] = Queue(maxsize=DEFAULT_QUEUE_SIZE)
+        self._stats[method] = {
+            "delivered": 0,
+            "failed": 0,
+            "dropped": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+        worker = threading.Thread(
+            target=self._deliver_alerts,
+            args=(method,),
+            name=f"alerter-{method}",
+            daemon=True,
+        )
+        self._workers[method] = worker
+        worker.start()
+
+    def _deliver_alerts(self, method: str) -> None:
+        """Deliver queued alerts for one transport until shut down."""
+        alert_queue = self._queues[method]
+        stopping = False
+        try:
+            while not stopping:
+                idle_timeout = None
+                if method == "smtp":
+                    idle_timeout = self._smtp_session.idle_timeout
+                try:
+                    item = alert_queue.get(timeout=idle_timeout)
+                except Empty:
+                    self._smtp_session.close_if_idle()
+                    continue
+                if item is None:
+                    return
+
+                batch = [item]
+                window = 0
+                if method == "smtp":
+                    window = item[1]["config"].get("digest_window", 0)
+                deadline = time.monotonic() + window
+                while time.monotonic() < deadline:
+                    try:
+                        item = alert_queue.get(timeout=deadline - time.monotonic())
+                    except Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                self._send_batch(method, batch)
+        finally:
+            if method == "smtp":
+                self._smtp_session.close()
+
+    def _send_batch(self, method: str, batch: list) -> None:
+        """Send a batch of queued alerts, one digest per SMTP recipient."""
+        if method == "smtp":
+            by_recipient = {}
+            for item in batch:
+                by_recipient.setdefault(item[1]["config"].get("to"), []).append(item)
+            groups = list(by_recipient.values())
+        else:
+            groups = [[item] for item in batch]
+
+        for items in groups:
+            try:
+                if len(items) > 1:
+                    delivered = self._send_smtp_digest([alert for _, alert in items])
+                elif method == "smtp":
+                    delivered = self._send_smtp_alert(**items[0][1])
+                else:
+                    delivered = self._send_icewatch_alert(**items[0][1])
+            except Exception as e:
+                self.logger.error(f"Error sending {method} alert: {e}")
+                delivered = False
+
+            now = time.monotonic()
+            with self._lock:
+                stats = self._stats[method]
+                for queued_at, _ in items:
+                    if delivered:
+                        latency = now - queued_at
+                        stats["delivered"] += 1
+                        stats["latency_total"] += latency
+                        stats["latency_max"] = max(stats["latency_max"], latency)
+                    else:
+                        stats["failed"] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return queue depth and delivery counters for each transport."""
+        with self._lock:
+            stats = {}
+            for method, counters in self._stats.items():
+                delivered = counters["delivered"]
+                stats[method] = {
+                    "queue_depth": self._queues[method].qsize(),
+                    "delivered": delivered,
+                    "failed": counters["failed"],
+                    "dropped": counters["dropped"],
+                    "latency_mean": counters["latency_total"] / delivered
+                    if delivered
+                    else 0.0,
+                    "latency_max": counters["latency_max"],
+                }
+            return stats
+
+    def shutdown(self, timeout: float = DEFAULT_SHUTDOWN_TIMEOUT) -> None:
+        """Stop accepting alerts and deliver what is queued within timeout."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._accepting = False
+            workers = dict(self._workers)
+
+        for method, worker in workers.items():
+            alert_queue = self._queues[method]
+            try:
+                alert_queue.put(None, timeout=max(deadline - time.monotonic(), 0))
+            except Full:
+                pass
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                self.logger.warning(
+                    f"Gave up on {alert_queue.qsize()} undelivered {method} alerts"
+                )
+
     def remove_method(self, method: str) -> None:
         """Remove an alert method."""
         with self._lock:
@@ -127,6 +289,7 @@ class Alerter:
                 "config": {"queue": queue},
                 "enabled": True,
             }
+            self._start_worker("icewatch")
 
     def _send_icewatch_alert(
         self, source: str, subject: str, body: str, config: dict, idempotency_token: str
@@ -153,32 +316,38 @@ class Alerter:
                 "config": smtp_config,
                 "enabled": smtp_config.get("sending_enabled", False),
             }
+            self._smtp_session.idle_timeout = smtp_config.get(
+                "idle_timeout", DEFAULT_SMTP_IDLE_TIMEOUT
+            )
+            self._start_worker("smtp")
 
     def _send_smtp_alert(
         self, source: str, subject: str, body: str, config: dict, idempotency_token: str
     ) -> bool:
         """Send an alert via SMTP."""
-        smtp_config = config
+        return self._send_smtp_message(config, f"[{source}] {subject}", body)
+
+    def _send_smtp_digest(self, alerts: list) -> bool:
+        """Send several alerts for the same recipient as one email."""
+        sources = ", ".join(sorted({alert["source"] for alert in alerts}))
+        subject = f"[{sources}] {len(alerts)} alerts: {alerts[0]['subject']}"
+        body = "\n\n".join(
+            f"{'-' * 72}\n[{alert['source']}] {alert['subject']}\n\n{alert['body']}"
+            for alert in alerts
+        )
+        return self._send_smtp_message(alerts[-1]["config"], subject, body)
+
+    def _send_smtp_message(self, smtp_config: dict, subject: str, body: str) -> bool:
         msg = MIMEMultipart()
         msg["From"] = smtp_config["from"]
         msg["To"] = smtp_config["to"]
-        msg["Subject"] = f"[{source}] {subject}"
+        msg["Subject"] = subject
         msg.attach(MIMEText(body, "plain"))
 
         try:
-            with socket.setdefaulttimeout(10):
-                server = smtplib.SMTP(
-                    host=smtp_config["smtp_server"],
-                    port=smtp_config["smtp_port"],
-                    timeout=10,
-                )
-                if smtp_config["tls"]:
-                    server.starttls()
-                server.login(smtp_config["smtp_user"], smtp_config["smtp_password"])
-                server.sendmail(smtp_config["from"], smtp_config["to"], msg.as_string())
-                server.quit()
-                self.logger.info("Alert email sent successfully")
-                return True
+            self._smtp_session.send(smtp_config, smtp_config["to"], msg.as_string())
+            self.logger.info("Alert email sent successfully")
+            return True
         except Exception as e:
             self.logger.error(f"Failed to send alert email: {e}")
             return False
@@ -1,11 +1,88 @@
+import copy
+import hashlib
 import json
 import threading
-from typing import Dict, Any, Callable, Set
+import weakref
+from typing import Dict, Any, Callable, List, NamedTuple, Optional, Set, Tuple
 
+from modules.json_patch import apply_patch
 from modules.logger import Logger
 
 
+def hash_config(config: Optional[Dict]) -> str:
+    """Generate SHA-256 hash of the compact config JSON string."""
+    if config is None:
+        return ""
+    config_str = json.dumps(config, separators=(",", ":"))
+    return hashlib.sha256(config_str.encode("utf-8")).hexdigest()
+
+
+def _child(value: Any, key: str) -> Any:
+    try:
+        return value[key]
+    except (KeyError, TypeError, IndexError):
+        return None
+
+
+def _lookup(config: Dict, path: Tuple[str, ...], default: Any = None) -> Any:
+    try:
+        value = config
+        for k in path:
+            value = value[k]
+        return value
+    except (KeyError, TypeError):
+        return default
+
+
+class ConfigSnapshot(NamedTuple):
+    """One published version of the config. Never modified once published."""
+
+    config: Dict
+    version: int
+    config_hash: str
+
+
+class ConfigAccessor:
+    """A config value that the store keeps up to date.
+
+    The key path is resolved once per config update, so reading value is a
+    plain attribute read.
+    """
+
+    __slots__ = ("key", "default", "value", "_path", "__weakref__")
+
+    def __init__(self, key: str, default: Any, config: Dict) -> None:
+        self.key = key
+        self.default = default
+        self._path = tuple(key.split('.'))
+        self._resolve(config)
+
+    def _resolve(self, config: Dict) -> None:
+        self.value = _lookup(config, self._path, self.default)
+
+
+class _ObserverNode:
+    """One key in the trie of watched config key paths."""
+
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_ObserverNode"] = {}
+        self.callbacks: Set[Callable[[Any], None]] = set()
+
+
 class ConfigStore:
+    """The current config, shared by every module.
+
+    Updates publish a new immutable snapshot by replacing a single
+    attribute, so readers never take the lock. The lock only serializes
+    writers and observer registration.
+
+    Observers are called on a notifier thread, never with the lock held.
+    Updates that arrive while observers are running are coalesced, so an
+    observer sees the latest value rather than every intermediate one.
+    """
+
     _instance = None
     _lock = threading.Lock()
 
@@ -13,10 +90,20 @@ class ConfigStore:
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(ConfigStore, cls).__new__(cls)
-                cls._instance._config = {}
-                cls._instance._observers = {}
+                cls._instance._snapshot = ConfigSnapshot({}, 0, hash_config({}))
+                cls._instance._observers = _ObserverNode()
+                cls._instance._notified = cls._instance._snapshot
+                cls._instance._changed = threading.Condition(cls._lock)
+                cls._instance._accessors = weakref.WeakSet()
+                cls._instance._paths = {}
                 cls._instance.logger = Logger.get_logger('config')
                 cls._instance.shutdown_flag = shutdown_flag or threading.Event()
+                cls._instance._notifier = threading.Thread(
+                    target=cls._instance._run_notifier,
+                    name="config-notifier",
+                    daemon=True,
+                )
+                cls._instance._notifier.start()
                 cls._instance.logger.debug("Created new ConfigStore instance")
             return cls._instance
 
@@ -29,61 +116,181 @@ class ConfigStore:
     def update_config(self, new_config: Dict) -> None:
         """Update the current config and notify relevant observers."""
         with self._lock:
-            old_config = self._config
-            self._config = new_config
-            self._notify_observers(old_config, new_config)
+            old_config = self._snapshot.config
+            if new_config == old_config:
+                return
+            # Copy so later changes by the caller cannot leak into the snapshot
+            self._publish(copy.deepcopy(new_config))
+
+    def apply_patch(self, operations: list, expected_hash: str = None) -> Dict:
+        """Apply a JSON patch to the config and notify affected observers.
+
+        The patched config shares every container off the patched paths with
+        the old one, so observers of those keys are skipped without
+        comparing their values.
+
+        Args:
+            operations (list): JSON patch (RFC 6902) operations
+            expected_hash (str): If set, the patch is rejected unless the
+                patched config has this hash
+
+        Returns:
+            Dict: The patched config
+
+        Raises:
+            ValueError: If the patch does not apply or the hash does not match
+        """
+        with self._lock:
+            old_config = self._snapshot.config
+            new_config, _ = apply_patch(old_config, operations)
+            new_hash = hash_config(new_config)
+            if expected_hash is not None and new_hash != expected_hash:
+                raise ValueError("patched config does not match the expected hash")
+            if new_config == old_config:
+                return new_config
+            self._publish(new_config, new_hash)
+            return new_config
+
+    def snapshot(self) -> ConfigSnapshot:
+        """Return the current config snapshot. Do not modify its config."""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """A counter that increases each time the config changes."""
+        return self._snapshot.version
+
+    @property
+    def config_hash(self) -> str:
+        """The hash of the current config, as sent to Icewatch."""
+        return self._snapshot.config_hash
+
+    def _publish(self, config: Dict, config_hash: str = None) -> None:
+        """Publish a new snapshot, refresh accessors and wake the notifier.
+
+        Call with _lock held.
+        """
+        self._snapshot = ConfigSnapshot(
+            config,
+            self._snapshot.version + 1,
+            config_hash or hash_config(config),
+        )
+        for accessor in list(self._accessors):
+            accessor._resolve(config)
+        self._changed.notify_all()
 
     def get_config(self) -> Dict:
         """Get the current config."""
-        with self._lock:
-            return self._config.copy()
+        return self._snapshot.config.copy()
 
     def get(self, key: str, default: Any = None) -> Any:
         """Get a config value by key path (e.g. 'smtp.server')."""
+        path = self._paths.get(key)
+        if path is None:
+            path = self._paths[key] = tuple(key.split('.'))
+        return _lookup(self._snapshot.config, path, default)
+
+    def accessor(self, key: str, default: Any = None) -> ConfigAccessor:
+        """Return an accessor whose value follows a key path.
+
+        Use this for values read on hot paths. The store holds accessors
+        weakly, so keep a reference for as long as it is needed.
+        """
         with self._lock:
-            try:
-                value = self._config
-                for k in key.split('.'):
-                    value = value[k]
-                return value
-            except (KeyError, TypeError):
-                return default
+            accessor = ConfigAccessor(key, default, self._snapshot.config)
+            self._accessors.add(accessor)
+            return accessor
 
     def watch(self, key: str, callback: Callable[[Any], None]) -> None:
         """Register to be notified when a specific config key changes."""
         with self._lock:
-            if key not in self._observers:
-                self._observers[key] = set()
-            self._observers[key].add(callback)
+            node = self._observers
+            for k in key.split('.'):
+                node = node.children.setdefault(k, _ObserverNode())
+            node.callbacks.add(callback)
             self.logger.debug(f"Added observer for {key}: {callback.__qualname__}")
 
     def unwatch(self, key: str, callback: Callable[[Any], None]) -> None:
         """Remove a config watch callback."""
         with self._lock:
-            if key in self._observers:
-                self._observers[key].discard(callback)
-                if not self._observers[key]:
-                    del self._observers[key]
-
-    def _notify_observers(self, old_config: Dict, new_config: Dict) -> None:
-        """Notify observers of relevant config changes."""
-        def get_value(config: Dict, key: str) -> Any:
-            try:
-                value = config
-                for k in key.split('.'):
-                    value = value[k]
-                return value
-            except (KeyError, TypeError):
-                return None
-
-        for key, observers in self._observers.items():
-            old_value = get_value(old_config, key)
-            new_value = get_value(new_config, key)
-
-            if old_value != new_value:
-                self.logger.debug(f"Config change for {key}: {old_value} -> {new_value}")
-                for callback in observers:
+            nodes = [self._observers]
+            for k in key.split('.'):
+                node = nodes[-1].children.get(k)
+                if node is None:
+                    return
+                nodes.append(node)
+            nodes[-1].callbacks.discard(callback)
+            # Prune the branch back to the nearest key still in use
+            for k, parent, node in zip(
+                reversed(key.split('.')), reversed(nodes[:-1]), reversed(nodes)
+            ):
+                if node.callbacks or node.children:
+                    break
+                del parent.children[k]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until observers have been notified of the current config.
+
+        Must not be called from an observer.
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        with self._changed:
+            version = self._snapshot.version
+            return self._changed.wait_for(
+                lambda: self._notified.version >= version, timeout
+            )
+
+    def _run_notifier(self) -> None:
+        """Call the observers of each changed key, outside the lock."""
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._notified.version != self._snapshot.version
+                )
+                old, new = self._notified, self._snapshot
+                pending = []
+                self._changed_observers(
+                    self._observers, old.config, new.config, "", pending
+                )
+
+            for callbacks, value in pending:
+                for callback in callbacks:
                     try:
-                        callback(new_value)
+                        callback(value)
                     except Exception as e:
-                        self.logger.error(f"Error in config observer {callback.__qualname__}: {e}")
+                        self.logger.error(
+                            f"Error in config observer {callback.__qualname__}: {e}"
+                        )
+
+            with self._changed:
+                self._notified = new
+                self._changed.notify_all()
+
+    def _changed_observers(
+        self,
+        node: _ObserverNode,
+        old_config: Any,
+        new_config: Any,
+        prefix: str,
+        pending: List[tuple],
+    ) -> None:
+        """Collect the observers of keys under node whose values changed.
+
+        Subtrees whose old and new values are the same object, or equal,
+        are skipped without visiting their observers. Call with _lock held.
+        """
+        for k, child in node.children.items():
+            old_value = _child(old_config, k)
+            new_value = _child(new_config, k)
+            if old_value is new_value or old_value == new_value:
+                continue
+            key = f"{prefix}{k}"
+            if child.callbacks:
+                self.logger.debug(f"Config change for {key}: {old_value} -> {new_value}")
+                pending.append((list(child.callbacks), new_value))
+            if child.children:
+                self._changed_observers(
+                    child, old_value, new_value, f"{key}.", pending
+                )
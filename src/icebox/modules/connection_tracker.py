@@ -0,0 +1,499 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from modules.logger import Logger
+from modules.sketch import CountMinSketch, HyperLogLog
+
+# Connections from one source within this many seconds of its first are
+# reported together
+DEFAULT_GROUPING_WINDOW = 1.0
+# A source's episode ends once it has been quiet this long
+DEFAULT_EPISODE_TIMEOUT = 900.0
+# Least recently seen sources are forgotten beyond this many
+DEFAULT_MAX_SOURCES = 10000
+# More new sources than this within FLOOD_INTERVAL switches to flood mode
+DEFAULT_FLOOD_SOURCES = 1000
+FLOOD_INTERVAL = 10.0
+# How long after a flood starts its summary is reported
+FLOOD_REPORT_DELAY = 10.0
+# How many of the busiest sources a flood summary lists
+FLOOD_TOP_SOURCES = 10
+
+# Sliding windows over which distinct ports are counted, in seconds
+WINDOWS = {"1s": 1.0, "1m": 60.0, "15m": 900.0}
+# Distinct ports within a window, per protocol, that make a source a scanner
+DEFAULT_THRESHOLDS = {
+    "tcp": {"1s": 4, "1m": 10, "15m": 20},
+    "udp": {"1s": 4, "1m": 10, "15m": 20},
+}
+
+PORT_SCAN = "PORT SCAN"
+PING = "PING"
+CONNECTION = "CONNECTION"
+
+# Classifications from least to most significant
+_RANK = {PING: 0, CONNECTION: 1, PORT_SCAN: 2}
+
+# A source's ports are kept in a set until it has connected to this many,
+# then in a bitmap covering every port
+_BITMAP_THRESHOLD = 256
+_PORT_COUNT = 65536
+
+
+class PortSet:
+    """The distinct ports one source has connected to.
+
+    Small sets are Python sets; once a source reaches _BITMAP_THRESHOLD
+    ports they move to an 8 KiB bitmap, so a full port scan costs the same
+    memory as a few hundred ports.
+    """
+
+    __slots__ = ("_ports", "_bitmap", "_count")
+
+    def __init__(self) -> None:
+        self._ports: Optional[set] = set()
+        self._bitmap: Optional[bytearray] = None
+        self._count = 0
+
+    def add(self, port: int) -> None:
+        if self._bitmap is None:
+            if port in self._ports:
+                return
+            self._ports.add(port)
+            self._count += 1
+            if self._count >= _BITMAP_THRESHOLD:
+                self._bitmap = bytearray(_PORT_COUNT // 8)
+                for p in self._ports:
+                    self._bitmap[p >> 3] |= 1 << (p & 7)
+                self._ports = None
+            return
+        mask = 1 << (port & 7)
+        if not self._bitmap[port >> 3] & mask:
+            self._bitmap[port >> 3] |= mask
+            self._count += 1
+
+    def __contains__(self, port: int) -> bool:
+        if self._bitmap is None:
+            return port in self._ports
+        return bool(self._bitmap[port >> 3] & (1 << (port & 7)))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over the ports in ascending order."""
+        if self._bitmap is None:
+            return iter(sorted(self._ports))
+        return (
+            (index << 3) | bit
+            for index, byte in enumerate(self._bitmap)
+            if byte
+            for bit in range(8)
+            if byte & (1 << bit)
+        )
+
+
+class TrackedSource:
+    """Activity from one source address during its current episode."""
+
+    __slots__ = (
+        "started",
+        "last_seen",
+        "connections",
+        "ports",
+        "windows",
+        "scan_window",
+        "classification",
+        "reported",
+    )
+
+    def __init__(self, now: float) -> None:
+        self.started = datetime.now(timezone.utc)
+        self.last_seen = now
+        self.connections = 0
+        self.ports = PortSet()
+        # Per protocol, the last time each port was seen in each window
+        self.windows: Dict[str, List["OrderedDict[int, float]"]] = {}
+        # The first window whose threshold was reached, if any
+        self.scan_window: Optional[str] = None
+        # The most significant activity in the current grouping window
+        self.classification: Optional[str] = None
+        self.reported = set()
+
+
+class ScanReport(NamedTuple):
+    """A copy of a source's activity, taken when it is reported."""
+
+    src_address: str
+    classification: str
+    started: datetime
+    connections: int
+    ports: List[int]
+    scan_window: Optional[str]
+
+
+class FloodReport(NamedTuple):
+    """Estimated activity during a flood. Counts are approximate."""
+
+    started: datetime
+    sources: int
+    connections: int
+    # (address, connections, distinct ports) for the busiest sources
+    top_sources: List[Tuple[str, int, int]]
+
+
+class FloodSummary:
+    """Activity while in flood mode, in memory that does not grow with it.
+
+    A count-min sketch estimates connections per source, and the busiest
+    sources are kept with a small HyperLogLog of the ports each hit.
+    HyperLogLogs also count the distinct sources, both overall and in the
+    current FLOOD_INTERVAL.
+    """
+
+    def __init__(self, now: float) -> None:
+        self.started = datetime.now(timezone.utc)
+        self.report_due = now + FLOOD_REPORT_DELAY
+        self.reported = False
+        self.next_check = now + FLOOD_INTERVAL
+        self.connections = 0
+        self.counts = CountMinSketch(width=8192, depth=4)
+        self.sources = HyperLogLog()
+        self.recent_sources = HyperLogLog()
+        self._top: Dict[str, list] = {}
+        self._floor = 0
+
+    def add(self, src_address: str, port: int) -> None:
+        self.connections += 1
+        count = self.counts.add(src_address)
+        self.sources.add(src_address)
+        self.recent_sources.add(src_address)
+
+        top = self._top.get(src_address)
+        if top is not None:
+            top[0] = count
+            top[1].add(port)
+            return
+        if len(self._top) >= FLOOD_TOP_SOURCES:
+            # Counts only grow, so the floor is a lower bound on the minimum
+            if count <= self._floor:
+                return
+            weakest = min(self._top, key=lambda address: self._top[address][0])
+            self._floor = self._top[weakest][0]
+            if count <= self._floor:
+                return
+            del self._top[weakest]
+        ports = HyperLogLog(precision=8)
+        ports.add(port)
+        self._top[src_address] = [count, ports]
+
+    def report(self) -> FloodReport:
+        top_sources = sorted(
+            (
+                (address, count, len(ports))
+                for address, (count, ports) in self._top.items()
+            ),
+            key=lambda top: top[1],
+            reverse=True,
+        )
+        return FloodReport(
+            self.started, len(self.sources), self.connections, top_sources
+        )
+
+
+class ConnectionTracker:
+    """Groups incoming connections into per-source episodes and spots scans.
+
+    A source's episode starts with its first connection and lasts until it
+    has been quiet for episode_timeout. A connection of a kind not yet
+    reported in the episode, such as the first one, a connection after a
+    ping, or the one that reveals a port scan, opens a grouping window, and
+    the window's most significant activity is reported when it ends.
+    Connections that keep a detected scan going are part of it, so a slow
+    scan is one or two alerts rather than dozens.
+
+    Distinct ports are counted per protocol over sliding 1s, 1m and 15m
+    windows; reaching a window's threshold marks the source as a scanner.
+    Sources are kept in least recently seen order and the oldest are
+    forgotten beyond max_sources. Reports are due in first-seen order, so
+    finding them only looks at sources that are due.
+
+    When more than flood_sources new sources appear within FLOOD_INTERVAL,
+    as in a spoofed SYN flood, the tracker switches to flood mode: sources
+    are no longer tracked one by one but summarized in fixed-size sketches,
+    and a single flood report replaces their alerts. It returns to exact
+    tracking once an interval sees fewer than half that many sources.
+    Safe to use from several threads.
+    """
+
+    def __init__(
+        self, window: float = DEFAULT_GROUPING_WINDOW, config: Optional[dict] = None
+    ) -> None:
+        self.window = window
+        self._sources: "OrderedDict[str, TrackedSource]" = OrderedDict()
+        # Sources waiting for their grouping window to end, with its deadline
+        self._pending: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.logger = Logger.get_logger("icicle")
+        self.evicted = 0
+        self._flood: Optional[FloodSummary] = None
+        self._flood_reports: List[FloodReport] = []
+        self._interval_start = None
+        self._interval_sources = 0
+        self.configure(config)
+
+    def configure(self, config: Optional[dict]) -> None:
+        """Apply the icicle config section. Missing settings use the defaults.
+
+        Raises:
+            ValueError: If a setting has the wrong type
+        """
+        config = config or {}
+        thresholds = {
+            protocol: dict(windows) for protocol, windows in DEFAULT_THRESHOLDS.items()
+        }
+        for protocol, windows in (config.get("thresholds") or {}).items():
+            thresholds.setdefault(protocol.lower(), {}).update(windows)
+        with self._lock:
+            self.episode_timeout = float(
+                config.get("episode_timeout", DEFAULT_EPISODE_TIMEOUT)
+            )
+            self.max_sources = int(config.get("max_sources", DEFAULT_MAX_SOURCES))
+            self.flood_sources = int(
+                config.get("flood_sources", DEFAULT_FLOOD_SOURCES)
+            )
+            self.thresholds = {
+                protocol: [windows.get(name) or 0 for name in WINDOWS]
+                for protocol, windows in thresholds.items()
+            }
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    @property
+    def flooding(self) -> bool:
+        """Whether the tracker is in flood mode."""
+        return self._flood is not None
+
+    def record(
+        self,
+        src_address: str,
+        protocol: str,
+        port: int,
+        now: Optional[float] = None,
+    ) -> bool:
+        """Record a connection from src_address to port.
+
+        Returns:
+            bool: True if a report may now be due sooner than before, so
+                whoever waits for the next deadline should wake up
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._flood is not None:
+                self._flood.add(src_address, port)
+                self._check_flood(now)
+                return False
+
+            self._expire_idle(now)
+            source = self._sources.get(src_address)
+            if source is None:
+                if self._count_new_source(now):
+                    self._start_flood(now)
+                    self._flood.add(src_address, port)
+                    return True
+                source = self._sources[src_address] = TrackedSource(now)
+                if len(self._sources) > self.max_sources:
+                    self._forget(next(iter(self._sources)))
+                    self.evicted += 1
+            else:
+                self._sources.move_to_end(src_address)
+            # A connection soon enough after the last one keeps a scan going
+            scanning = (
+                source.scan_window is not None
+                and now - source.last_seen <= WINDOWS[source.scan_window]
+            )
+            source.last_seen = now
+            source.connections += 1
+            source.ports.add(port)
+
+            if source.scan_window is None:
+                source.scan_window = self._count_port(source, protocol, port, now)
+                scanning = source.scan_window is not None
+            if scanning:
+                classification = PORT_SCAN
+            elif port == 0:
+                classification = PING
+            else:
+                classification = CONNECTION
+
+            if src_address in self._pending:
+                if _RANK[classification] > _RANK[source.classification]:
+                    source.classification = classification
+                return False
+            if classification in source.reported:
+                return False
+            source.classification = classification
+            # Every window is as long, so deadlines stay in insertion order
+            wake = not self._pending
+            self._pending[src_address] = now + self.window
+            return wake
+
+    def due_reports(
+        self, now: Optional[float] = None
+    ) -> List[Union[ScanReport, FloodReport]]:
+        """Return the reports that are due.
+
+        A source is reported when a grouping window ends, as the most
+        significant activity in it. Each classification is reported once per
+        episode. A flood is reported once, FLOOD_REPORT_DELAY after it
+        starts or when it ends if that is sooner.
+        """
+        now = time.monotonic() if now is None else now
+        reports = []
+        with self._lock:
+            if self._flood is not None:
+                self._check_flood(now)
+            flood = self._flood
+            if flood is not None and not flood.reported and now >= flood.report_due:
+                flood.reported = True
+                reports.append(flood.report())
+            reports.extend(self._flood_reports)
+            self._flood_reports.clear()
+
+            self._expire_idle(now)
+            while self._pending:
+                src_address, deadline = next(iter(self._pending.items()))
+                if deadline > now:
+                    break
+                del self._pending[src_address]
+                self._report(src_address, reports)
+        return reports
+
+    def time_until_next_deadline(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until the next report is due, or None if none are pending."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._flood_reports:
+                return 0.0
+            deadlines = []
+            if self._pending:
+                deadlines.append(next(iter(self._pending.values())))
+            if self._flood is not None:
+                # Wake for the flood check too, so flood mode can end even if
+                # no more packets arrive
+                deadlines.append(self._flood.next_check)
+                if not self._flood.reported:
+                    deadlines.append(self._flood.report_due)
+            if not deadlines:
+                return None
+            return max(0.0, min(deadlines) - now)
+
+    def _count_new_source(self, now: float) -> bool:
+        """Count a new source and return True if that makes it a flood."""
+        if (
+            self._interval_start is None
+            or now - self._interval_start >= FLOOD_INTERVAL
+        ):
+            self._interval_start = now
+            self._interval_sources = 0
+        self._interval_sources += 1
+        return self._interval_sources > self.flood_sources
+
+    def _start_flood(self, now: float) -> None:
+        """Switch to flood mode.
+
+        The sources first seen in this interval are part of the flood, so
+        they are dropped rather than reported one by one. Sources seen
+        before it, including those in a later grouping window, are still
+        tracked exactly.
+        """
+        self.logger.warning(
+            f"More than {self.flood_sources} new sources in {FLOOD_INTERVAL:.0f}s, "
+            f"switching to flood mode"
+        )
+        self._flood = FloodSummary(now)
+        flood_start = self._interval_start + self.window
+        for src_address, deadline in reversed(list(self._pending.items())):
+            if deadline < flood_start:
+                break
+            if not self._sources[src_address].reported:
+                self._forget(src_address)
+
+    def _check_flood(self, now: float) -> None:
+        """End flood mode once an interval sees few enough sources."""
+        flood = self._flood
+        if now < flood.next_check:
+            return
+        if len(flood.recent_sources) >= self.flood_sources / 2:
+            flood.recent_sources = HyperLogLog()
+            flood.next_check = now + FLOOD_INTERVAL
+            return
+        self.logger.warning("Flood has subsided, returning to exact tracking")
+        self._flood = None
+        self._interval_start = None
+        if not flood.reported:
+            self._flood_reports.append(flood.report())
+
+    def _count_port(
+        self, source: TrackedSource, protocol: str, port: int, now: float
+    ) -> Optional[str]:
+        """Slide each window forward and return the first one at its threshold.
+
+        Windows stop being updated once a source is known to be scanning, so
+        none ever holds more ports than its threshold.
+        """
+        limits = self.thresholds.get(protocol.lower())
+        if not limits:
+            return None
+        windows = source.windows.get(protocol)
+        if windows is None:
+            windows = source.windows[protocol] = [OrderedDict() for _ in WINDOWS]
+
+        crossed = None
+        for name, span, seen, limit in zip(WINDOWS, WINDOWS.values(), windows, limits):
+            seen[port] = now
+            seen.move_to_end(port)
+            cutoff = now - span
+            while next(iter(seen.values())) < cutoff:
+                seen.popitem(last=False)
+            if crossed is None and limit and len(seen) >= limit:
+                crossed = name
+        return crossed
+
+    def _report(self, src_address: str, reports: List[ScanReport]) -> None:
+        source = self._sources.get(src_address)
+        if source is None:
+            return
+        classification = source.classification
+        if classification in source.reported:
+            return
+        source.reported.add(classification)
+        if 0 in source.ports:
+            # A ping grouped with other traffic is covered by this report
+            source.reported.add(PING)
+        reports.append(
+            ScanReport(
+                src_address,
+                classification,
+                source.started,
+                source.connections,
+                list(source.ports),
+                source.scan_window,
+            )
+        )
+
+    def _expire_idle(self, now: float) -> None:
+        """End the episodes of sources that have been quiet too long."""
+        while self._sources:
+            src_address, source = next(iter(self._sources.items()))
+            if source.last_seen + self.episode_timeout > now:
+                break
+            self._forget(src_address)
+
+    def _forget(self, src_address: str) -> None:
+        del self._sources[src_address]
+        self._pending.pop(src_address, None)
@@ -0,0 +1,57 @@
+import re
+from typing import Callable, Dict, List
+
+
+class EventSource:
+    """Base class for the process-wide sources of tagged iptables events.
+
+    A source produces lines in the iptables LOG format, e.g.
+    "ICICLE: IN=eth0 OUT= MAC=... SRC=... PROTO=TCP SPT=... DPT=...", and
+    routes them in batches to the handlers subscribed to the tag they carry.
+    Subclasses are singletons that set up _lock and _routes in __new__ and
+    implement start() and stop().
+    """
+
+    def subscribe(self, tag: str, handler: Callable[[List[str]], None]) -> None:
+        """Route batches of lines containing tag to handler."""
+        with self._lock:
+            handlers = {t: list(h) for t, h in self._routes[0].items()}
+            handlers.setdefault(tag.encode(), []).append(handler)
+            self._set_routes(handlers)
+
+    def unsubscribe(self, tag: str, handler: Callable[[List[str]], None]) -> None:
+        """Stop routing lines to handler, stopping the source when unused."""
+        with self._lock:
+            handlers = {t: list(h) for t, h in self._routes[0].items()}
+            tag_handlers = handlers.get(tag.encode(), [])
+            if handler in tag_handlers:
+                tag_handlers.remove(handler)
+                if not tag_handlers:
+                    del handlers[tag.encode()]
+            self._set_routes(handlers)
+
+        if not handlers:
+            self.stop()
+
+    def _set_routes(self, handlers: Dict[bytes, List[Callable]]) -> None:
+        pattern = None
+        if handlers:
+            pattern = re.compile(b"|".join(re.escape(tag) for tag in sorted(handlers)))
+        # Swap in a new pair so readers never need the lock
+        self._routes = (handlers, pattern)
+
+    def _deliver(self, batches: Dict[bytes, List[str]]) -> None:
+        """Hand each batch of lines to the handlers of its tag."""
+        handlers = self._routes[0]
+        for tag, lines in batches.items():
+            for handler in handlers.get(tag, []):
+                handler(lines)
+
+    def set_file_path(self, file_path: str) -> None:
+        """Point the source at a new log file, if it reads one."""
+
+    def start(self) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        raise NotImplementedError
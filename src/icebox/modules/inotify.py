@@ -0,0 +1,112 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from typing import Optional
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc() -> ctypes.CDLL:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    # Raises AttributeError on platforms without inotify
+    libc.inotify_init1
+    libc.inotify_add_watch
+    libc.inotify_rm_watch
+    return libc
+
+
+class Inotify:
+    """Minimal ctypes binding for Linux inotify.
+
+    wait() blocks until a watched path changes or wake() is called from
+    another thread, so an idle watcher does not wake up at all.
+    """
+
+    def __init__(self) -> None:
+        try:
+            self._libc = _load_libc()
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._poller = select.poll()
+        self._poller.register(self.fd, select.POLLIN)
+        self._poller.register(self._wake_read, select.POLLIN)
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """Watch path for the events in mask and return the watch descriptor."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed: {os.strerror(errno)}")
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        """Remove a watch, ignoring watches the kernel already dropped."""
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        """Block until an event arrives, wake() is called, or timeout expires.
+
+        Returns:
+            int: The OR of all pending event masks, or 0 if none arrived
+        """
+        timeout_ms = None if timeout is None else int(timeout * 1000)
+        try:
+            self._poller.poll(timeout_ms)
+        except InterruptedError:
+            pass
+
+        try:
+            while os.read(self._wake_read, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+        mask = 0
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, event_mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                mask |= event_mask
+                offset += _EVENT_HEADER.size + name_len
+        return mask
+
+    def wake(self) -> None:
+        """Interrupt a blocked wait() from another thread."""
+        try:
+            os.write(self._wake_write, b"\0")
+        except OSError:
+            # Pipe already full (a wake is pending) or closed
+            pass
+
+    def close(self) -> None:
+        for fd in (self.fd, self._wake_read, self._wake_write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,89 @@
+import copy
+from typing import Any, List, Tuple
+
+Path = Tuple[str, ...]
+
+
+def parse_pointer(pointer: str) -> Path:
+    """Split a JSON pointer (RFC 6901) such as "/icepick/0" into its keys.
+
+    Raises:
+        ValueError: If pointer is not empty and does not start with "/"
+    """
+    if not pointer:
+        return ()
+    if not pointer.startswith("/"):
+        raise ValueError(f"invalid JSON pointer: {pointer!r}")
+    return tuple(
+        key.replace("~1", "/").replace("~0", "~") for key in pointer[1:].split("/")
+    )
+
+
+def apply_patch(document: Any, operations: list) -> Tuple[Any, List[Path]]:
+    """Apply JSON patch (RFC 6902) add, remove and replace operations.
+
+    The document is not modified. Only the containers on each operation's
+    path are copied, so the rest of the result is shared with the document.
+
+    Returns:
+        Tuple[Any, List[Path]]: The patched document, and the path of each
+            operation applied
+
+    Raises:
+        ValueError: If an operation is malformed or does not apply
+    """
+    changed = []
+    for operation in operations:
+        try:
+            op = operation["op"]
+            path = parse_pointer(operation["path"])
+            if op not in ("add", "remove", "replace"):
+                raise ValueError(f"unsupported op {op!r}")
+            if op != "remove" and "value" not in operation:
+                raise ValueError("missing value")
+            document = _patched(document, path, op, operation.get("value"))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ValueError(f"cannot apply {operation}: {e!r}") from e
+        changed.append(path)
+    return document, changed
+
+
+def _patched(document: Any, path: Path, op: str, value: Any) -> Any:
+    if not path:
+        if op == "remove":
+            raise ValueError("cannot remove the whole document")
+        return value
+
+    key, rest = path[0], path[1:]
+    container = copy.copy(document)
+    if isinstance(container, dict):
+        if rest:
+            container[key] = _patched(container[key], rest, op, value)
+        elif op == "add":
+            container[key] = value
+        elif op == "remove":
+            del container[key]
+        elif key not in container:
+            raise KeyError(key)
+        else:
+            container[key] = value
+    elif isinstance(container, list):
+        if key == "-" and op == "add" and not rest:
+            index = len(container)
+        elif key.isdigit():
+            index = int(key)
+        else:
+            raise ValueError(f"invalid list index {key!r}")
+        if rest:
+            container[index] = _patched(container[index], rest, op, value)
+        elif op == "add":
+            if index > len(container):
+                raise IndexError(index)
+            container.insert(index, value)
+        elif op == "remove":
+            del container[index]
+        else:
+            container[index] = value
+    else:
+        raise TypeError(f"cannot index {type(container).__name__} with {key!r}")
+    return container
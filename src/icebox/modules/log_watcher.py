@@ -1,61 +1,470 @@
 import threading
 import queue
+import json
 import time
 import os
-from typing import Callable
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from modules.logger import Logger
+from modules.config_store import ConfigStore
+from modules.event_source import EventSource
+from modules.nflog import NflogSource
+from modules.inotify import (
+    Inotify,
+    IN_ATTRIB,
+    IN_MODIFY,
+    IN_MOVE_SELF,
+    IN_DELETE_SELF,
+)
+
+# IN_DELETE_SELF only fires once the file is closed; unlinking a file we
+# still hold open is reported as IN_ATTRIB, for the link count change
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+MIN_POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 1.0
+CHECKPOINT_INTERVAL = 10
+# How long a rotated file is still read while the new one stays empty
+ROTATION_GRACE = 5.0
+DEFAULT_CHECKPOINT_PATH = "/opt/icebox/log_checkpoint.json"
+DEFAULT_MAX_CATCHUP_AGE = 900
+CHUNK_SIZE = 256 * 1024
+MAX_LINE_LENGTH = 64 * 1024
+
+
+class LogTailer(EventSource):
+    """Process-wide reader for the iptables log file.
+
+    The file is read once and every line is routed to the handlers registered
+    for the tags it contains, so all ice cubes share a single reader thread.
+    New lines are picked up through inotify where available, falling back to
+    polling that backs off while the file is idle.
+
+    The tailer follows the path across rotation and truncation and
+    periodically records a (path, inode, offset) checkpoint. After a
+    rotation it keeps reading the old file until the writer moves to the
+    new one. On start it replays whatever was written since the checkpoint,
+    including the tail of the rotated file, unless the checkpoint is older
+    than the catch-up limit or was taken for another file.
+
+    Reads are done in large binary chunks. Tags are matched on the raw bytes
+    so that unrelated kernel noise is never split into lines or decoded, and
+    each handler receives the matching lines of a chunk as one batch.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(LogTailer, cls).__new__(cls)
+                cls._instance.logger = Logger.get_logger("log_watcher")
+                cls._instance.file_path = None
+                cls._instance._routes = ({}, None)
+                cls._instance._carry = b""
+                cls._instance._thread = None
+                cls._instance.shutdown_flag = threading.Event()
+                cls._instance.use_inotify = True
+                cls._instance._inotify = None
+                cls._instance._watch = None
+                cls._instance._open_path = None
+                cls._instance._wake_event = threading.Event()
+                cls._instance._poll_interval = MIN_POLL_INTERVAL
+                cls._instance.checkpoint_path = DEFAULT_CHECKPOINT_PATH
+                cls._instance.max_catchup_age = DEFAULT_MAX_CATCHUP_AGE
+                cls._instance._checkpoint = None
+                cls._instance._checkpoint_time = 0
+                cls._instance._rotated_since = None
+                cls._instance.logger.debug("Created new LogTailer instance")
+            return cls._instance
+
+    def set_file_path(self, file_path: str) -> None:
+        """Point the tailer at a new log file, reopening it if running."""
+        if file_path != self.file_path:
+            self.logger.debug(f"Tailing log file {file_path}")
+            self.file_path = file_path
+            self._wake()
+
+    def start(self) -> None:
+        """Start the reader thread if it is not already running."""
+        config_store = ConfigStore()
+        self.checkpoint_path = config_store.get(
+            "iptables.checkpoint_file", self.checkpoint_path
+        )
+        self.max_catchup_age = config_store.get(
+            "iptables.max_catchup_age", self.max_catchup_age
+        )
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.shutdown_flag.clear()
+            self._thread = threading.Thread(target=self.watch_log_file, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the reader thread."""
+        self.shutdown_flag.set()
+        self._wake()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def watch_log_file(self) -> None:
+        if not os.path.exists(self.file_path):
+            raise FileNotFoundError(f"Log file not found: {self.file_path}")
+
+        self._open_inotify()
+        self._carry = b""
+        self._rotated_since = None
+        file = self._resume(self.file_path)
+        try:
+            while not self.shutdown_flag.is_set():
+                if self.file_path != self._open_path:
+                    file.close()
+                    self.logger.info(f"Switching to log file {self.file_path}")
+                    file = self._open_log_file(self.file_path)
+                    file.seek(0, 2)
+                    self._carry = b""
+
+                if self._read_available(file):
+                    self._poll_interval = MIN_POLL_INTERVAL
+
+                timeout = self._save_checkpoint_due(file)
+                if self._rotated_since is not None:
+                    # Nothing reports writes to the new file, so poll for them
+                    timeout = min(timeout or MAX_POLL_INTERVAL, MAX_POLL_INTERVAL)
+                self._wait_for_data(timeout)
+                file = self._check_rotation(file)
+                if file is None:
+                    break
+        finally:
+            if file is not None:
+                self._save_checkpoint(file)
+                file.close()
+            self._close_inotify()
+
+    def _resume(self, file_path: str) -> BinaryIO:
+        """Open the log file where the last checkpoint left off."""
+        file = self._open_log_file(file_path)
+        checkpoint = self._load_checkpoint()
+        if checkpoint is None:
+            file.seek(0, 2)
+            return file
+
+        age = time.time() - checkpoint["timestamp"]
+        if age > self.max_catchup_age:
+            self.logger.warning(
+                f"Log checkpoint is {age:.0f}s old, skipping the backlog"
+            )
+            file.seek(0, 2)
+            return file
+
+        if checkpoint["path"] not in (None, file_path):
+            self.logger.info(
+                f"Log checkpoint is for {checkpoint['path']}, skipping the backlog"
+            )
+            file.seek(0, 2)
+            return file
+
+        stat = os.fstat(file.fileno())
+        if checkpoint["inode"] == stat.st_ino:
+            offset = checkpoint["offset"] if checkpoint["offset"] <= stat.st_size else 0
+        elif self._replay_rotated(file_path, checkpoint):
+            offset = 0
+        else:
+            self.logger.warning(
+                f"Log checkpoint matches no file at {file_path}, skipping the backlog"
+            )
+            file.seek(0, 2)
+            return file
+
+        self.logger.info(
+            f"Replaying {stat.st_size - offset} bytes of {file_path} "
+            f"written since the last checkpoint"
+        )
+        file.seek(offset)
+        return file
+
+    def _replay_rotated(self, file_path: str, checkpoint: dict) -> bool:
+        """Replay the unread tail of the file that was rotated away.
+
+        Returns:
+            bool: False if the checkpoint is not for the rotated file
+        """
+        rotated_path = f"{file_path}.1"
+        try:
+            with open(rotated_path, "rb") as rotated:
+                if os.fstat(rotated.fileno()).st_ino != checkpoint["inode"]:
+                    return False
+                self.logger.info(f"Replaying the rotated log file {rotated_path}")
+                rotated.seek(checkpoint["offset"])
+                self._read_to_end(rotated)
+                return True
+        except OSError:
+            return False
+
+    def _read_available(self, file: BinaryIO) -> bool:
+        """Dispatch every complete line up to the end of the file.
+
+        A trailing partial line is carried over until the writer finishes it.
+
+        Returns:
+            bool: True if any data was read
+        """
+        read_any = False
+        while not self.shutdown_flag.is_set():
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            read_any = True
+            data = self._carry + chunk if self._carry else chunk
+            end = data.rfind(b"\n") + 1
+            if end:
+                self.dispatch(data[:end])
+            self._carry = data[end:]
+            if len(self._carry) > MAX_LINE_LENGTH:
+                self.logger.warning("Discarding overlong line in log file")
+                self._carry = b""
+        return read_any
+
+    def _read_to_end(self, file: BinaryIO) -> None:
+        """Dispatch the rest of a file that will not be written to again."""
+        self._read_available(file)
+        if self._carry:
+            self.dispatch(self._carry + b"\n")
+            self._carry = b""
+
+    def _check_rotation(self, file: BinaryIO) -> Optional[BinaryIO]:
+        """Follow the log path if the file was replaced or truncated."""
+        file_path = self._open_path
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            stat = None
+
+        if stat is not None and stat.st_ino == os.fstat(file.fileno()).st_ino:
+            if stat.st_size < file.tell():
+                self.logger.info(f"Log file {file_path} was truncated")
+                file.seek(0)
+                self._carry = b""
+            return file
+
+        # The writer keeps appending to the old file until it is told to
+        # reopen the path, so keep reading it until the new file has data
+        now = time.monotonic()
+        if self._rotated_since is None:
+            self.logger.info(f"Log file {file_path} was rotated")
+            self._rotated_since = now
+        if (stat is None or stat.st_size == 0) and (
+            now - self._rotated_since < ROTATION_GRACE
+        ):
+            return file
+
+        self._rotated_since = None
+        self._read_to_end(file)
+        file.close()
+        self.logger.info(f"Reopening log file {file_path}")
+        return self._reopen_log_file()
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            return {
+                # Checkpoints from before the path was recorded have none
+                "path": checkpoint.get("path"),
+                "inode": int(checkpoint["inode"]),
+                "offset": int(checkpoint["offset"]),
+                "timestamp": float(checkpoint["timestamp"]),
+            }
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.warning(f"Ignoring unreadable log checkpoint: {e}")
+            return None
+
+    def _save_checkpoint(self, file: BinaryIO) -> None:
+        """Atomically record the current path, inode and offset."""
+        self._checkpoint_time = time.monotonic()
+        try:
+            offset = file.tell() - len(self._carry)
+            checkpoint = (self._open_path, os.fstat(file.fileno()).st_ino, offset)
+            if checkpoint == self._checkpoint:
+                return
+            tmp_path = f"{self.checkpoint_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {
+                        "path": checkpoint[0],
+                        "inode": checkpoint[1],
+                        "offset": checkpoint[2],
+                        "timestamp": time.time(),
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.checkpoint_path)
+            self._checkpoint = checkpoint
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Failed to save log checkpoint: {e}")
+
+    def _save_checkpoint_due(self, file: BinaryIO) -> Optional[float]:
+        """Save the checkpoint if due.
+
+        Returns:
+            Optional[float]: Seconds until the next save, or None if idle
+        """
+        elapsed = time.monotonic() - self._checkpoint_time
+        if elapsed >= CHECKPOINT_INTERVAL:
+            self._save_checkpoint(file)
+            return None
+        return CHECKPOINT_INTERVAL - elapsed
+
+    def _open_inotify(self) -> None:
+        if not self.use_inotify:
+            self.logger.debug("Polling log file for changes")
+            return
+        try:
+            self._inotify = Inotify()
+            self.logger.debug("Watching log file with inotify")
+        except OSError as e:
+            self.logger.warning(f"{e}, falling back to polling")
+            self._inotify = None
+
+    def _close_inotify(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._watch = None
+
+    def _open_log_file(self, file_path: str) -> BinaryIO:
+        """Open file_path and move the inotify watch over to it."""
+        if self._inotify is not None:
+            if self._watch is not None:
+                self._inotify.rm_watch(self._watch)
+            self._watch = self._inotify.add_watch(file_path, WATCH_MASK)
+        self._open_path = file_path
+        return open(file_path, "rb")
+
+    def _reopen_log_file(self) -> Optional[BinaryIO]:
+        """Wait for a moved or deleted log file to be recreated."""
+        while not self.shutdown_flag.is_set():
+            if os.path.exists(self.file_path):
+                return self._open_log_file(self.file_path)
+            self._wake_event.wait(MAX_POLL_INTERVAL)
+            self._wake_event.clear()
+        return None
+
+    def _wait_for_data(self, timeout: Optional[float] = None) -> int:
+        """Block until the log file changes or timeout expires.
+
+        Returns:
+            int: The inotify event mask, or 0 when polling
+        """
+        if self._inotify is not None:
+            # WATCH_MASK covers rotation and deletion, so an idle file needs
+            # no timeout; polling is left to _reopen_log_file
+            return self._inotify.wait(timeout)
+
+        if timeout is None or timeout > self._poll_interval:
+            timeout = self._poll_interval
+        self._wake_event.wait(timeout)
+        self._wake_event.clear()
+        self._poll_interval = min(self._poll_interval * 2, MAX_POLL_INTERVAL)
+        return 0
+
+    def _wake(self) -> None:
+        self._wake_event.set()
+        inotify = self._inotify
+        if inotify is not None:
+            inotify.wake()
+
+    def dispatch(self, data: bytes) -> None:
+        """Route the complete lines in data to the handlers of their tags."""
+        pattern = self._routes[1]
+        if pattern is None:
+            return
+
+        batches: Dict[bytes, List[str]] = {}
+        line_end = 0
+        for match in pattern.finditer(data):
+            if match.start() < line_end:
+                # Another tag on a line that was already routed
+                continue
+            line_start = data.rfind(b"\n", 0, match.start()) + 1
+            line_end = data.find(b"\n", match.end())
+            if line_end == -1:
+                line_end = len(data)
+            line = data[line_start:line_end].strip()
+            batches.setdefault(match.group(), []).append(
+                line.decode("utf-8", errors="replace")
+            )
+
+        self._deliver(batches)
+
+
+def get_event_source() -> EventSource:
+    """Get the shared event source selected by iptables.source."""
+    if ConfigStore().get("iptables.source", "log") == "nflog":
+        return NflogSource()
+    return LogTailer()
 
 
 class LogWatcher:
+    """Delivers lines tagged with tag to message_handler on a worker thread.
+
+    Lines are handed over from the event source in batches, one queue
+    operation per read, and passed to message_handler one at a time.
+
+    The watcher subscribes to the shared source when it is created, so lines
+    replayed from the backlog on start are queued for every ice cube.
+    """
+
     def __init__(
         self, file_path: str, tag: str, message_handler: Callable[[str], None]
     ) -> None:
-        self.file_path = file_path
         self.tag = tag
         self.message_handler = message_handler
         self.message_queue = queue.Queue()
         self.shutdown_flag = threading.Event()
         self.threads = []
+        self.source = get_event_source()
+        self.file_path = file_path
+        self.source.subscribe(self.tag, self.message_queue.put)
 
-    def start(self) -> None:
-        log_watcher_thread = threading.Thread(target=self.watch_log_file)
-        message_worker_thread = threading.Thread(target=self.process_messages)
+    @property
+    def file_path(self) -> str:
+        return self._file_path
 
-        self.threads.extend([log_watcher_thread, message_worker_thread])
+    @file_path.setter
+    def file_path(self, file_path: str) -> None:
+        self._file_path = file_path
+        self.source.set_file_path(file_path)
 
-        for thread in self.threads:
-            thread.daemon = True
-            thread.start()
+    def start(self) -> None:
+        message_worker_thread = threading.Thread(
+            target=self.process_messages, daemon=True
+        )
+        self.threads.append(message_worker_thread)
+        message_worker_thread.start()
+        self.source.start()
 
     def stop(self) -> None:
+        self.source.unsubscribe(self.tag, self.message_queue.put)
         self.shutdown_flag.set()
         self.message_queue.put(None)
         for thread in self.threads:
             thread.join()
 
-    def watch_log_file(self) -> None:
-        if not os.path.exists(self.file_path):
-            raise FileNotFoundError(f"Log file not found: {self.file_path}")
-
-        with open(self.file_path, "r") as file:
-            file.seek(0, 2)
-
-            while not self.shutdown_flag.is_set():
-                line = file.readline()
-                if not line:
-                    time.sleep(1)
-                    continue
-
-                if self.tag in line:
-                    self.message_queue.put(line.strip())
-
     def process_messages(self) -> None:
         while not self.shutdown_flag.is_set():
             try:
-                message = self.message_queue.get(timeout=1)
-                if message is None:
+                messages = self.message_queue.get(timeout=1)
+                if messages is None:
                     break
-                if message:
-                    self.message_handler(message)
+                for message in messages:
+                    if message:
+                        self.message_handler(message)
                 self.message_queue.task_done()
             except queue.Empty:
                 continue
@@ -0,0 +1,69 @@
+import re
+from typing import Iterable, Iterator, Optional, TextIO
+
+BROADCAST = 0xFFFFFFFFFFFF
+# The I/G and U/L bits are the two lowest bits of the first octet
+GROUP_BIT = 1 << 40
+LOCAL_BIT = 1 << 41
+
+# Matches aa:bb:cc:dd:ee:ff and aa-bb-cc-dd-ee-ff anywhere in a line, which
+# covers CSV exports as well as `ip neigh` and `arp -a` output
+_MAC = re.compile(r"(?<![0-9A-Fa-f:-])((?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2})\b")
+
+
+def parse_mac(mac: str) -> int:
+    """Parse a colon or dash separated MAC address into a 48-bit integer.
+
+    Raises:
+        ValueError: If mac is not a MAC address
+    """
+    digits = mac.replace(":", "").replace("-", "")
+    if len(digits) != 12:
+        raise ValueError(f"invalid MAC address: {mac!r}")
+    return int(digits, 16)
+
+
+def format_mac(mac: int) -> str:
+    """Format a 48-bit MAC address as aa:bb:cc:dd:ee:ff."""
+    return "%02x:%02x:%02x:%02x:%02x:%02x" % tuple(mac.to_bytes(6, "big"))
+
+
+def is_broadcast(mac: int) -> bool:
+    return mac == BROADCAST
+
+
+def is_multicast(mac: int) -> bool:
+    """True for group addresses, including broadcast."""
+    return bool(mac & GROUP_BIT)
+
+
+def is_locally_administered(mac: int) -> bool:
+    return bool(mac & LOCAL_BIT)
+
+
+def find_mac(line: str) -> Optional[int]:
+    """Return the first MAC address in a line of text, if any."""
+    match = _MAC.search(line)
+    return parse_mac(match.group(1)) if match else None
+
+
+def read_macs(lines: Iterable[str]) -> Iterator[int]:
+    """Yield the first unicast MAC address found on each line.
+
+    Accepts a CSV with a MAC column, `ip neigh` or `arp -a` output. Lines
+    without a MAC address, such as headers or FAILED neighbours, are skipped.
+    """
+    for line in lines:
+        mac = find_mac(line)
+        if mac is not None and not is_multicast(mac):
+            yield mac
+
+
+def write_macs(macs: Iterable[int], file: TextIO) -> int:
+    """Write MAC addresses as a single-column CSV and return the count."""
+    file.write("mac_address\n")
+    count = 0
+    for mac in macs:
+        file.write(format_mac(mac) + "\n")
+        count += 1
+    return count
@@ -0,0 +1,316 @@
+import os
+import select
+import socket
+import struct
+import threading
+from typing import Callable, Dict, List, Optional
+
+from modules.logger import Logger
+from modules.config_store import ConfigStore
+from modules.event_source import EventSource
+
+NETLINK_NETFILTER = 12
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+
+NFNL_SUBSYS_ULOG = 4
+NFULNL_MSG_PACKET = 0
+NFULNL_MSG_CONFIG = 1
+
+NFULA_CFG_CMD = 1
+NFULA_CFG_MODE = 2
+NFULNL_CFG_CMD_BIND = 1
+NFULNL_CFG_CMD_PF_BIND = 3
+NFULNL_COPY_PACKET = 2
+
+NFULA_PACKET_HDR = 1
+NFULA_IFINDEX_INDEV = 4
+NFULA_IFINDEX_OUTDEV = 5
+NFULA_PAYLOAD = 9
+NFULA_PREFIX = 10
+NFULA_HWHEADER = 16
+
+NLA_TYPE_MASK = 0x3FFF
+
+DEFAULT_GROUP = 5
+COPY_RANGE = 256
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NFGENMSG = struct.Struct("!BBH")
+_NLATTR = struct.Struct("=HH")
+
+IP_PROTOCOLS = {1: "ICMP", 2: "IGMP", 6: "TCP", 17: "UDP", 58: "ICMPv6"}
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _attr(attr_type: int, payload: bytes) -> bytes:
+    length = _NLATTR.size + len(payload)
+    return _NLATTR.pack(length, attr_type) + payload + b"\0" * (
+        _align(length) - length
+    )
+
+
+def _config_command(command: int) -> bytes:
+    return _attr(NFULA_CFG_CMD, struct.pack("B", command))
+
+
+def build_config_message(family: int, group: int, attrs: bytes, seq: int = 0) -> bytes:
+    """Build an NFULNL_MSG_CONFIG request for the given log group."""
+    body = _NFGENMSG.pack(family, 0, group) + attrs
+    return (
+        _NLMSGHDR.pack(
+            _NLMSGHDR.size + len(body),
+            (NFNL_SUBSYS_ULOG << 8) | NFULNL_MSG_CONFIG,
+            NLM_F_REQUEST | NLM_F_ACK,
+            seq,
+            0,
+        )
+        + body
+    )
+
+
+def build_packet_message(
+    attrs: Dict[int, bytes], family: int = socket.AF_INET
+) -> bytes:
+    """Build an NFULNL_MSG_PACKET message, as the kernel sends for NFLOG."""
+    body = _NFGENMSG.pack(family, 0, 0) + b"".join(
+        _attr(attr_type, payload) for attr_type, payload in attrs.items()
+    )
+    return (
+        _NLMSGHDR.pack(
+            _NLMSGHDR.size + len(body),
+            (NFNL_SUBSYS_ULOG << 8) | NFULNL_MSG_PACKET,
+            0,
+            0,
+            0,
+        )
+        + body
+    )
+
+
+def parse_attributes(data: bytes, offset: int = 0) -> Dict[int, bytes]:
+    """Parse a run of netlink attributes into a type -> payload mapping."""
+    attrs = {}
+    while offset + _NLATTR.size <= len(data):
+        length, attr_type = _NLATTR.unpack_from(data, offset)
+        if length < _NLATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[
+            offset + _NLATTR.size : offset + length
+        ]
+        offset += _align(length)
+    return attrs
+
+
+def _interface_name(attrs: Dict[int, bytes], attr_type: int) -> str:
+    if attr_type not in attrs:
+        return ""
+    index = struct.unpack("!I", attrs[attr_type][:4])[0]
+    try:
+        return socket.if_indextoname(index)
+    except OSError:
+        return str(index)
+
+
+def format_packet(attrs: Dict[int, bytes]) -> Optional[str]:
+    """Render an NFLOG packet as the line an iptables LOG rule would write.
+
+    Returns:
+        Optional[str]: The log line, or None for packets that are not IP
+    """
+    prefix = attrs.get(NFULA_PREFIX, b"").split(b"\0", 1)[0].decode(
+        "utf-8", errors="replace"
+    )
+    payload = attrs.get(NFULA_PAYLOAD, b"")
+    if not payload:
+        return None
+
+    fields = [
+        f"IN={_interface_name(attrs, NFULA_IFINDEX_INDEV)}",
+        f"OUT={_interface_name(attrs, NFULA_IFINDEX_OUTDEV)}",
+    ]
+    if NFULA_HWHEADER in attrs:
+        mac = ":".join(f"{b:02x}" for b in attrs[NFULA_HWHEADER])
+        fields.append(f"MAC={mac}")
+
+    version = payload[0] >> 4
+    if version == 4 and len(payload) >= 20:
+        header_length = (payload[0] & 0x0F) * 4
+        total_length, ttl, protocol = (
+            struct.unpack("!H", payload[2:4])[0],
+            payload[8],
+            payload[9],
+        )
+        fields += [
+            f"SRC={socket.inet_ntop(socket.AF_INET, payload[12:16])}",
+            f"DST={socket.inet_ntop(socket.AF_INET, payload[16:20])}",
+            f"LEN={total_length}",
+            f"TTL={ttl}",
+        ]
+    elif version == 6 and len(payload) >= 40:
+        header_length = 40
+        total_length = struct.unpack("!H", payload[4:6])[0] + 40
+        protocol, ttl = payload[6], payload[7]
+        fields += [
+            f"SRC={socket.inet_ntop(socket.AF_INET6, payload[8:24])}",
+            f"DST={socket.inet_ntop(socket.AF_INET6, payload[24:40])}",
+            f"LEN={total_length}",
+            f"HOPLIMIT={ttl}",
+        ]
+    else:
+        return None
+
+    fields.append(f"PROTO={IP_PROTOCOLS.get(protocol, protocol)}")
+    transport = payload[header_length:]
+    if protocol in (6, 17) and len(transport) >= 4:
+        source_port, dest_port = struct.unpack("!HH", transport[:4])
+        fields += [f"SPT={source_port}", f"DPT={dest_port}"]
+    elif protocol in (1, 58) and len(transport) >= 2:
+        fields += [f"TYPE={transport[0]}", f"CODE={transport[1]}"]
+
+    return prefix + " ".join(fields)
+
+
+def open_netlink_socket() -> socket.socket:
+    """Open and bind an NFLOG netlink socket. Requires CAP_NET_ADMIN."""
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_NETFILTER)
+    sock.bind((0, 0))
+    return sock
+
+
+class NflogSource(EventSource):
+    """Event source that reads packets from an iptables NFLOG group.
+
+    Rules installed with -j NFLOG --nflog-group N --nflog-prefix "ICICLE: "
+    deliver packet metadata straight to a netlink socket, bypassing the
+    kernel ring buffer, syslog and the disk. Each packet is rendered as the
+    line the equivalent -j LOG rule would have produced.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, socket_factory: Callable[[], socket.socket] = None):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(NflogSource, cls).__new__(cls)
+                cls._instance.logger = Logger.get_logger("nflog")
+                cls._instance._routes = ({}, None)
+                cls._instance._thread = None
+                cls._instance._socket = None
+                cls._instance.socket_factory = open_netlink_socket
+                cls._instance.group = DEFAULT_GROUP
+                cls._instance.shutdown_flag = threading.Event()
+                cls._instance._wake_read, cls._instance._wake_write = os.pipe()
+                cls._instance.logger.debug("Created new NflogSource instance")
+            if socket_factory is not None:
+                cls._instance.socket_factory = socket_factory
+            return cls._instance
+
+    def start(self) -> None:
+        """Bind to the NFLOG group and start the reader thread."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.group = ConfigStore().get("iptables.nflog_group", self.group)
+            self._socket = self.socket_factory()
+            self._configure(self._socket)
+            self.shutdown_flag.clear()
+            self._thread = threading.Thread(target=self.read_packets, daemon=True)
+            self._thread.start()
+            self.logger.info(
+                f"Reading iptables events from NFLOG group {self.group}"
+            )
+
+    def stop(self) -> None:
+        """Stop the reader thread and close the socket."""
+        self.shutdown_flag.set()
+        os.write(self._wake_write, b"\0")
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _configure(self, sock: socket.socket) -> None:
+        """Bind the socket to the log group and ask for packet headers."""
+        for family in (socket.AF_INET, socket.AF_INET6):
+            sock.send(
+                build_config_message(
+                    family, 0, _config_command(NFULNL_CFG_CMD_PF_BIND)
+                )
+            )
+        sock.send(
+            build_config_message(
+                socket.AF_UNSPEC, self.group, _config_command(NFULNL_CFG_CMD_BIND)
+            )
+        )
+        sock.send(
+            build_config_message(
+                socket.AF_UNSPEC,
+                self.group,
+                _attr(
+                    NFULA_CFG_MODE,
+                    struct.pack("!IBB", COPY_RANGE, NFULNL_COPY_PACKET, 0),
+                ),
+            )
+        )
+
+    def read_packets(self) -> None:
+        sock = self._socket
+        try:
+            while not self.shutdown_flag.is_set():
+                readable, _, _ = select.select([sock, self._wake_read], [], [])
+                if self._wake_read in readable:
+                    os.read(self._wake_read, 512)
+                    continue
+                try:
+                    data = sock.recv(65536)
+                except OSError as e:
+                    # ENOBUFS means the kernel dropped events under load
+                    self.logger.warning(f"Error reading from NFLOG socket: {e}")
+                    continue
+                self.dispatch(data)
+        finally:
+            sock.close()
+
+    def dispatch(self, data: bytes) -> None:
+        """Route every packet in a netlink datagram by its prefix."""
+        pattern = self._routes[1]
+        if pattern is None:
+            return
+
+        batches: Dict[bytes, List[str]] = {}
+        offset = 0
+        while offset + _NLMSGHDR.size <= len(data):
+            length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+            if length < _NLMSGHDR.size:
+                break
+            message = data[offset : offset + length]
+            offset += _align(length)
+
+            if msg_type == NLMSG_ERROR:
+                error = struct.unpack_from("=i", message, _NLMSGHDR.size)[0]
+                if error:
+                    self.logger.error(
+                        f"NFLOG configuration failed: {os.strerror(-error)}"
+                    )
+                continue
+            if msg_type != (NFNL_SUBSYS_ULOG << 8) | NFULNL_MSG_PACKET:
+                continue
+
+            attrs = parse_attributes(message, _NLMSGHDR.size + _NFGENMSG.size)
+            match = pattern.search(attrs.get(NFULA_PREFIX, b""))
+            if match is None:
+                continue
+            try:
+                line = format_packet(attrs)
+            except (ValueError, struct.error) as e:
+                self.logger.error(f"Error parsing NFLOG packet: {e}")
+                continue
+            if line is not None:
+                batches.setdefault(match.group(), []).append(line)
+
+        self._deliver(batches)
@@ -0,0 +1,131 @@
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_CAPACITY = 64
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class RuleHistory:
+    """The recent results of one Icepick rule and its running totals."""
+
+    # (sequence, result, latency) tuples, oldest first
+    results: Deque[Tuple[int, dict, float]]
+    last_state: Optional[str] = None
+    last_change: Optional[float] = None
+    successes: int = 0
+    failures: int = 0
+
+
+class ResultStore:
+    """Bounded, thread-safe store of Icepick probe results.
+
+    Each rule keeps its last `capacity` results in a ring buffer, so memory
+    stays flat however long Icewatch is unreachable. Results are numbered as
+    they are recorded. snapshot() returns those not yet acknowledged, and
+    acknowledge() marks them as delivered once a check-in has succeeded.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self._rules: Dict[str, RuleHistory] = {}
+        self._sequence = 0
+        self._acknowledged = 0
+        self._snapshot: Optional[Tuple[int, List[dict]]] = None
+        self._lock = threading.Lock()
+
+    def record(
+        self, rule_id: str, status: str, latency: float, timestamp: float
+    ) -> dict:
+        """Record the outcome of one probe.
+
+        Returns:
+            dict: The result as reported to Icewatch
+        """
+        result = {"ruleId": rule_id, "timestamp": timestamp, "result": status}
+        with self._lock:
+            history = self._rules.get(rule_id)
+            if history is None:
+                history = self._rules[rule_id] = RuleHistory(
+                    results=deque(maxlen=self.capacity)
+                )
+            self._sequence += 1
+            history.results.append((self._sequence, result, latency))
+            if status == "success":
+                history.successes += 1
+            else:
+                history.failures += 1
+            if status != history.last_state:
+                history.last_state = status
+                history.last_change = timestamp
+            self._snapshot = None
+        return result
+
+    def snapshot(self) -> Tuple[int, List[dict]]:
+        """Return the unacknowledged results in the order they were recorded.
+
+        The list is shared between callers until the next change and must not
+        be modified.
+
+        Returns:
+            Tuple[int, List[dict]]: The sequence number to acknowledge once the
+                results are delivered, and the results
+        """
+        with self._lock:
+            if self._snapshot is None:
+                pending = [
+                    entry
+                    for history in self._rules.values()
+                    for entry in history.results
+                    if entry[0] > self._acknowledged
+                ]
+                pending.sort(key=lambda entry: entry[0])
+                self._snapshot = (self._sequence, [entry[1] for entry in pending])
+            return self._snapshot
+
+    def acknowledge(self, sequence: int) -> None:
+        """Mark every result up to sequence as delivered."""
+        with self._lock:
+            if sequence > self._acknowledged:
+                self._acknowledged = sequence
+                self._snapshot = None
+
+    def retain(self, rule_ids: Iterable[str]) -> None:
+        """Forget the history of rules that are no longer configured."""
+        keep = set(rule_ids)
+        with self._lock:
+            for rule_id in list(self._rules):
+                if rule_id not in keep:
+                    del self._rules[rule_id]
+            self._snapshot = None
+
+    def rollups(self) -> Dict[str, dict]:
+        """Summarize each rule: state, last change, counts and latency."""
+        with self._lock:
+            rollups = {
+                rule_id: {
+                    "lastState": history.last_state,
+                    "lastChange": history.last_change,
+                    "successes": history.successes,
+                    "failures": history.failures,
+                    "latency": [entry[2] for entry in history.results],
+                }
+                for rule_id, history in self._rules.items()
+            }
+
+        # Sort outside the lock so probes are not held up
+        for rollup in rollups.values():
+            rollup["latency"] = _percentiles(sorted(rollup["latency"]))
+        return rollups
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    """Nearest-rank percentiles of an already sorted list."""
+    if not values:
+        return {}
+    return {
+        f"p{p}": values[min(len(values) * p // 100, len(values) - 1)]
+        for p in PERCENTILES
+    }
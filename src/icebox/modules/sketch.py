@@ -0,0 +1,88 @@
+import math
+from array import array
+from typing import Hashable
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash64(item: Hashable) -> int:
+    """Return a well mixed 64-bit hash of item.
+
+    Python's hash() maps small ints to themselves, so it is passed through
+    the splitmix64 finalizer before its bits are used.
+    """
+    x = (hash(item) + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class CountMinSketch:
+    """Approximate counts of items in a fixed amount of memory.
+
+    Estimates never undercount. With width w and depth d, an estimate
+    exceeds the true count by more than 2N/w, where N is the total of all
+    counts, with probability at most 2^-d.
+    """
+
+    __slots__ = ("width", "depth", "_rows")
+
+    def __init__(self, width: int = 2048, depth: int = 4) -> None:
+        self.width = width
+        self.depth = depth
+        self._rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def add(self, item: Hashable, count: int = 1) -> int:
+        """Count item and return its new estimated count."""
+        h = hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        estimate = None
+        for i, row in enumerate(self._rows):
+            index = (h1 + i * h2) % self.width
+            value = row[index] + count
+            row[index] = value
+            if estimate is None or value < estimate:
+                estimate = value
+        return estimate
+
+    def estimate(self, item: Hashable) -> int:
+        h = hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        return min(
+            row[(h1 + i * h2) % self.width] for i, row in enumerate(self._rows)
+        )
+
+
+class HyperLogLog:
+    """Approximate count of distinct items in 2^precision bytes.
+
+    The standard error is about 1.04 / sqrt(2^precision), e.g. 1.6% at the
+    default precision of 12.
+    """
+
+    __slots__ = ("precision", "_registers")
+
+    def __init__(self, precision: int = 12) -> None:
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, item: Hashable) -> None:
+        h = hash64(item)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def __len__(self) -> int:
+        """Return the estimated number of distinct items added."""
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting is more accurate here
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
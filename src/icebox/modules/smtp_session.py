@@ -0,0 +1,86 @@
+import smtplib
+import time
+from typing import Optional
+
+from modules.logger import Logger
+
+SMTP_TIMEOUT = 10
+
+
+class SmtpSession:
+    """A reusable SMTP connection for the alert delivery thread.
+
+    The connection, including STARTTLS and login, is opened on the first
+    send and reused until it has been idle for idle_timeout seconds, the
+    server drops it, or the SMTP config changes. A send that fails on a
+    reused connection is retried once on a fresh one. Not thread-safe: each
+    session belongs to a single delivery thread.
+    """
+
+    def __init__(self, idle_timeout: float) -> None:
+        self.idle_timeout = idle_timeout
+        self.logger = Logger.get_logger("smtp")
+        self.connections_opened = 0
+        self._server: Optional[smtplib.SMTP] = None
+        self._config: Optional[dict] = None
+        self._last_used = 0.0
+
+    def send(self, config: dict, recipient: str, message: str) -> None:
+        """Send a message, reconnecting if needed.
+
+        Raises:
+            smtplib.SMTPException, OSError: If the message could not be sent
+        """
+        if self._server is not None and config != self._config:
+            self.close()
+
+        reused = self._server is not None
+        if not reused:
+            self._connect(config)
+        try:
+            self._server.sendmail(config["from"], recipient, message)
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+            self.close()
+            if not reused:
+                raise
+            self.logger.debug("SMTP connection was lost, reconnecting")
+            self._connect(config)
+            self._server.sendmail(config["from"], recipient, message)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self) -> None:
+        if (
+            self._server is not None
+            and time.monotonic() - self._last_used >= self.idle_timeout
+        ):
+            self.logger.debug("Closing idle SMTP connection")
+            self.close()
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _connect(self, config: dict) -> None:
+        server = smtplib.SMTP(
+            host=config["smtp_server"],
+            port=config.get("smtp_port", 0),
+            timeout=SMTP_TIMEOUT,
+        )
+        try:
+            if config.get("tls"):
+                server.starttls()
+            if config.get("smtp_user"):
+                server.login(config["smtp_user"], config["smtp_password"])
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._config = config
+        self._last_used = time.monotonic()
+        self.connections_opened += 1
+        self.logger.debug(f"Opened SMTP connection to {config['smtp_server']}")
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+from typing import List, Tuple
+
+from modules.logger import Logger
+from modules.alerter import Alert
+
+DEFAULT_MAX_ALERTS = 100000
+
+
+class AlertSpool:
+    """Durable, ordered queue of alerts waiting to be sent to Icewatch.
+
+    Alerts are appended to an SQLite table in WAL mode, so they survive
+    restarts and power loss. Readers peek() a batch in the order the alerts
+    were spooled and acknowledge() it once delivered, which removes it; a
+    batch that fails to send stays at the head and is retried in order.
+    When the spool holds max_alerts, the oldest alerts are dropped.
+    """
+
+    def __init__(self, path: str, max_alerts: int = DEFAULT_MAX_ALERTS) -> None:
+        self.path = path
+        self.max_alerts = max_alerts
+        self.logger = Logger.get_logger("spool")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    idempotency_token TEXT NOT NULL
+                )
+            """
+            )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+        if self._count:
+            self.logger.info(f"Resuming with {self._count} spooled alerts")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, alert: Alert) -> None:
+        """Add an alert to the tail of the spool."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO alerts
+                    (source, subject, body, timestamp, idempotency_token)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                (
+                    alert.source,
+                    alert.subject,
+                    alert.body,
+                    alert.timestamp,
+                    alert.idempotency_token,
+                ),
+            )
+            self._count += 1
+            if self._count > self.max_alerts:
+                overflow = self._count - self.max_alerts
+                self._conn.execute(
+                    "DELETE FROM alerts WHERE id IN "
+                    "(SELECT id FROM alerts ORDER BY id LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+                self.logger.warning(f"Spool full, dropped {overflow} oldest alerts")
+
+    def peek(self, limit: int) -> List[Tuple[int, Alert]]:
+        """Return up to limit alerts from the head of the spool, with their ids."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT id, source, subject, body, timestamp, idempotency_token
+                FROM alerts ORDER BY id LIMIT ?
+            """,
+                (limit,),
+            ).fetchall()
+        return [(row[0], Alert(*row[1:])) for row in rows]
+
+    def acknowledge(self, last_id: int) -> None:
+        """Remove every alert up to and including last_id."""
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM alerts WHERE id <= ?", (last_id,)
+            ).rowcount
+            self._count -= deleted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
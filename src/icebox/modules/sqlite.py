@@ -1,67 +1,197 @@
 import sqlite3
+import threading
+from typing import Iterable, List, Set
 
 from modules.logger import Logger
+from modules.mac import parse_mac
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_FLUSH_SIZE = 100
+
+PRAGMAS = [
+    "journal_mode = WAL",
+    # Safe with WAL: a power cut can lose the last commits, never corrupt
+    "synchronous = NORMAL",
+    "mmap_size = 67108864",
+    "busy_timeout = 5000",
+]
+
+
+def _add_unique_index(conn: sqlite3.Connection, table: str) -> None:
+    conn.execute(
+        f"""
+        DELETE FROM {table} WHERE id NOT IN (
+            SELECT MIN(id) FROM {table} GROUP BY mac_address
+        )
+    """
+    )
+    conn.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_mac_address "
+        f"ON {table} (mac_address)"
+    )
+
+
+def _store_macs_as_integers(conn: sqlite3.Connection, table: str) -> None:
+    rows = conn.execute(f"SELECT mac_address FROM {table}").fetchall()
+    conn.execute(f"CREATE TABLE {table}_new (mac_address INTEGER PRIMARY KEY)")
+    macs = []
+    for (mac_address,) in rows:
+        try:
+            macs.append((parse_mac(mac_address),))
+        except ValueError:
+            pass
+    conn.executemany(f"INSERT OR IGNORE INTO {table}_new VALUES (?)", macs)
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+# MIGRATIONS[n] upgrades a database from PRAGMA user_version n to n + 1
+MIGRATIONS = [_add_unique_index, _store_macs_as_integers]
 
 
 class SQLiteDB:
+    """Known MAC addresses, answered from memory and persisted write-behind.
+
+    Addresses are 48-bit integers, see modules.mac.
 
-    def __init__(self, db_path: str, table_name: str = "mac_addresses") -> None:
+    The known set is loaded once at startup. New addresses are added to it
+    immediately and buffered, and the buffer is written in one transaction
+    every flush_interval seconds, once it holds flush_size addresses, or on
+    close(). A single long-lived connection in WAL mode is shared by all
+    threads and serialized by a lock.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        table_name: str = "mac_addresses",
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        flush_size: int = DEFAULT_FLUSH_SIZE,
+    ) -> None:
         self.db_path = db_path
         self.table_name = table_name
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
         self.logger = Logger.get_logger("SQLite")
         self.logger.debug(
             f"Initializing SQLite DB at {db_path} with table {table_name}"
         )
+        self._known: Set[int] = set()
+        self._pending: List[int] = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._closed = threading.Event()
         self.init_db()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
 
     def init_db(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS {self.table_name} (
-                    id INTEGER PRIMARY KEY,
-                    mac_address TEXT NOT NULL
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._db_lock:
+            for pragma in PRAGMAS:
+                self._conn.execute(f"PRAGMA {pragma}")
+            with self._conn:
+                self._conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {self.table_name} (
+                        id INTEGER PRIMARY KEY,
+                        mac_address TEXT NOT NULL
+                    )
+                """
                 )
-            """
-            )
-            conn.commit()
+            self._migrate()
+            cursor = self._conn.execute(f"SELECT mac_address FROM {self.table_name}")
+            self._known = {row[0] for row in cursor}
+        self.logger.debug(f"Loaded {len(self._known)} known MAC addresses")
 
-    def insert_mac_address(self, mac_address: str) -> bool:
-        if self.is_known_mac(mac_address):
-            return False
+    def _migrate(self) -> None:
+        """Bring an existing database up to the current schema version."""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            self.logger.info(f"Migrating {self.db_path} to schema version {target}")
+            with self._conn:
+                # Without an explicit BEGIN, DDL would run outside the transaction
+                self._conn.execute("BEGIN")
+                migration(self._conn, self.table_name)
+                self._conn.execute(f"PRAGMA user_version = {target}")
 
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    f"""
-                    INSERT INTO {self.table_name} (mac_address)
-                    VALUES (?)
-                """,
-                    (mac_address,),
+    def insert_mac_address(self, mac_address: int) -> bool:
+        """Learn a MAC address.
+
+        Returns:
+            bool: True if the address was not known before
+        """
+        with self._buffer_lock:
+            if mac_address in self._known:
+                return False
+            self._known.add(mac_address)
+            self._pending.append(mac_address)
+            flush_due = len(self._pending) >= self.flush_size
+
+        if flush_due:
+            self.flush()
+        return True
+
+    def insert_mac_addresses(self, mac_addresses: Iterable[int]) -> int:
+        """Learn many MAC addresses at once, writing them in one transaction.
+
+        Returns:
+            int: The number of addresses that were not known before
+        """
+        self.flush()
+        with self._flush_lock:
+            with self._buffer_lock:
+                new = set(mac_addresses) - self._known
+            with self._db_lock, self._conn:
+                self._conn.executemany(
+                    f"INSERT OR IGNORE INTO {self.table_name} (mac_address) "
+                    "VALUES (?)",
+                    [(mac_address,) for mac_address in new],
                 )
-                conn.commit()
-            return True
-        except sqlite3.Error as e:
-            self.logger.error(f"An error occurred: {e}")
-            return False
+            with self._buffer_lock:
+                self._known |= new
+        return len(new)
 
-    def is_known_mac(self, mac_address: str) -> bool:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    f"""
-                    SELECT EXISTS(
-                        SELECT 1 FROM {self.table_name}
-                        WHERE mac_address = ?
+    def is_known_mac(self, mac_address: int) -> bool:
+        return mac_address in self._known
+
+    def known_macs(self) -> List[int]:
+        """Return all known MAC addresses in ascending order."""
+        with self._buffer_lock:
+            return sorted(self._known)
+
+    def flush(self) -> None:
+        """Write all buffered addresses in a single transaction."""
+        with self._flush_lock:
+            with self._buffer_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            try:
+                with self._db_lock, self._conn:
+                    self._conn.executemany(
+                        f"INSERT OR IGNORE INTO {self.table_name} (mac_address) "
+                        "VALUES (?)",
+                        [(mac_address,) for mac_address in pending],
                     )
-                """,
-                    (mac_address,),
-                )
-                result = cursor.fetchone()[0] == 1
-            return result
-        except sqlite3.Error as e:
-            self.logger.error(f"An error occurred: {e}")
-            return False
+                self.logger.debug(f"Wrote {len(pending)} MAC addresses")
+            except sqlite3.Error as e:
+                self.logger.error(f"An error occurred: {e}")
+                # Keep the addresses so the next flush retries them
+                with self._buffer_lock:
+                    self._pending = pending + self._pending
+
+    def close(self) -> None:
+        """Stop the flusher and write out anything still buffered."""
+        self._closed.set()
+        if self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
@@ -1,3 +1,4 @@
+import gzip
 import json
 from typing import Any
 import requests
@@ -29,10 +30,16 @@ def get_raw_http(response: requests.Response) -> tuple[str, str]:
             )
         return "\n".join(f"{k}: {v}" for k, v in headers.items())
 
+    body = request.body or b""
+    if isinstance(body, bytes):
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        body = body.decode()
+
     raw_request = (
         f"{request.method} {request.url} {http_version}\n"
         f"{format_headers(request.headers)}\n"
-        f"\n{request.body.decode() if request.body else ''}"
+        f"\n{body}"
     )
 
     raw_response = (
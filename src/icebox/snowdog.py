@@ -1,13 +1,18 @@
-import re
+import argparse
+import sys
 import time
 import threading
-from typing import Tuple
+from typing import Optional, Tuple
 
 from modules.alerter import Alerter
 from modules.logger import Logger
 from modules.sqlite import SQLiteDB
 from modules.log_watcher import LogWatcher
 from modules.config_store import ConfigStore
+from modules.packet import PacketRecord
+from modules.mac import format_mac, is_multicast, read_macs, write_macs
+
+DEFAULT_DB_FILE = "/opt/icebox/snowdog.sqlite"
 
 
 class Snowdog:
@@ -20,6 +25,9 @@ class Snowdog:
             self.logger = Logger.get_logger("snowdog")
 
             self.icebox_name = self.config_store.get("icebox.name")
+            # Read for every message, so resolved once per config update
+            self.learning = self.config_store.accessor("snowdog.learning")
+            self.alerting = self.config_store.accessor("snowdog.alerting")
             self.config_store.watch("iptables.log_file", self._handle_log_file_change)
             self.config_store.watch("smtp", self._handle_smtp_config_change)
             self.config_store.watch("snowdog", self._handle_snowdog_config_change)
@@ -29,6 +37,9 @@ class Snowdog:
             if self.config_store.get("smtp"):
                 self.alerter.configure_smtp(self.config_store.get("smtp"))
 
+            # Held while inserting, so a replaced database is never written
+            # to after it has been closed
+            self._db_lock = threading.Lock()
             self.db = SQLiteDB(self.config_store.get("snowdog.db_file"))
             self.log_watcher = LogWatcher(
                 file_path=self.iptables_log,
@@ -54,11 +65,14 @@ class Snowdog:
 
     def _handle_snowdog_config_change(self, new_config: dict) -> None:
         """Handle changes to Snowdog configuration."""
-        if hasattr(self, "db"):
-            self.logger.info(
-                f"Updating Snowdog database file path to {new_config['db_file']}"
-            )
-            self.db = SQLiteDB(new_config["db_file"])
+        db_file = (new_config or {}).get("db_file")
+        if not hasattr(self, "db") or db_file == self.db.db_path:
+            return
+        self.logger.info(f"Updating Snowdog database file path to {db_file}")
+        new_db = SQLiteDB(db_file)
+        with self._db_lock:
+            old_db, self.db = self.db, new_db
+        old_db.close()
 
     def stop(self) -> None:
         self.logger.info("Stopping snowdog")
@@ -66,6 +80,8 @@ class Snowdog:
         try:
             if hasattr(self, "log_watcher"):
                 self.log_watcher.stop()
+            if hasattr(self, "db"):
+                self.db.close()
         except Exception as e:
             self.logger.error(f"Error during cleanup: {e}")
             raise
@@ -90,14 +106,16 @@ class Snowdog:
         try:
             self.logger.debug(f"Detected broadcast traffic: {message}")
 
-            if self.config_store.get("snowdog.learning"):
+            if self.learning.value:
                 self.learn_mac_addresses(message)
             elif self.has_unknown_macs(message):
-                if self.config_store.get("snowdog.alerting"):
+                if self.alerting.value:
+                    source_mac, _ = self.get_mac_addresses(message)
                     self.alerter.alert(
                         source="snowdog",
                         subject=f"{self.icebox_name}: Unknown MAC address detected",
                         body=f"An unknown MAC address was detected.\n\n{message}",
+                        key=format_mac(source_mac),
                     )
                 else:
                     self.logger.warn(
@@ -110,10 +128,17 @@ class Snowdog:
     def learn_mac_addresses(self, message: str) -> None:
         try:
             source_mac, destination_mac = self.get_mac_addresses(message)
-            if source_mac and destination_mac:
+            if source_mac is not None and destination_mac is not None:
                 for mac_address in [source_mac, destination_mac]:
-                    if self.db.insert_mac_address(mac_address):
-                        self.logger.info(f"Learned MAC address: {mac_address}")
+                    # Group addresses never identify a device
+                    if is_multicast(mac_address):
+                        continue
+                    with self._db_lock:
+                        learned = self.db.insert_mac_address(mac_address)
+                    if learned:
+                        self.logger.info(
+                            f"Learned MAC address: {format_mac(mac_address)}"
+                        )
         except Exception as e:
             self.logger.error(
                 f"Error learning MAC addresses: {e}, " f"message: {message}"
@@ -122,12 +147,13 @@ class Snowdog:
     def has_unknown_macs(self, message: str) -> bool:
         try:
             source_mac, destination_mac = self.get_mac_addresses(message)
-            if not source_mac or not destination_mac:
+            if source_mac is None or destination_mac is None:
                 self.logger.error(f"Unsupported message format: {message}")
                 return False
-            return not (
-                self.db.is_known_mac(source_mac)
-                and self.db.is_known_mac(destination_mac)
+            return any(
+                not is_multicast(mac_address)
+                and not self.db.is_known_mac(mac_address)
+                for mac_address in [source_mac, destination_mac]
             )
         except Exception as e:
             self.logger.error(
@@ -135,12 +161,41 @@ class Snowdog:
             )
             return False
 
-    def get_mac_addresses(self, message: str) -> Tuple[str, str]:
-        mac_match = re.search(r"MAC=((?:[a-f0-9]{2}:){12}[a-f0-9]{2})", message)
-        if mac_match:
-            mac_str = mac_match.group(1)
-            parts = mac_str.split(":")
-            dest_mac = ":".join(parts[0:6])
-            src_mac = ":".join(parts[6:12])
-            return src_mac, dest_mac
-        return None, None
+    def get_mac_addresses(self, message: str) -> Tuple[Optional[int], Optional[int]]:
+        """Return the source and destination MAC addresses as integers."""
+        return PacketRecord(message).mac_addresses
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Seed or back up the known MAC addresses without running Icebox."""
+    parser = argparse.ArgumentParser(
+        description="Import or export the MAC addresses known to Snowdog."
+    )
+    parser.add_argument("--db", default=DEFAULT_DB_FILE, help="Snowdog database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser(
+        "import", help="learn MACs from a CSV, `ip neigh` or `arp -a` output"
+    )
+    import_parser.add_argument("file", help="input file, or - for stdin")
+    export_parser = commands.add_parser("export", help="write known MACs as CSV")
+    export_parser.add_argument("file", help="output file, or - for stdout")
+    args = parser.parse_args(argv)
+
+    Logger.configure(log_file="/dev/null", log_level="WARNING")
+    db = SQLiteDB(args.db)
+    try:
+        if args.command == "import":
+            with sys.stdin if args.file == "-" else open(args.file) as f:
+                count = db.insert_mac_addresses(read_macs(f))
+            print(f"Imported {count} new MAC addresses", file=sys.stderr)
+        else:
+            with sys.stdout if args.file == "-" else open(args.file, "w") as f:
+                count = write_macs(db.known_macs(), f)
+            print(f"Exported {count} MAC addresses", file=sys.stderr)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,27 @@
+import os
+import sys
 import pytest
 import paramiko
 import time
 from datetime import datetime
 from pathlib import Path
 
+# Ice cubes import their helpers as top-level modules, as when run from
+# /opt/icebox/icebox, so mirror that layout for unit tests.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "icebox"))
+
+from modules.logger import Logger
+
+Logger.configure(log_file=os.devnull, log_level="DEBUG")
+
+
+def wait_for(condition, timeout=5):
+    """Poll condition until it is true or timeout seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
 # Test configuration
 TEST_CONFIG = {
     "SELF_HOST": "192.168.20.10",
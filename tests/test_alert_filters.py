@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+from modules.alert_filters import AlertFilterIndex
+from modules.config_store import ConfigStore
+from modules.connection_tracker import ScanReport
+
+
+def test_substring_filters_keep_their_semantics():
+    index = AlertFilterIndex(
+        [
+            {"source": "snowdog", "subject": "", "body": "67"},
+            {"source": "icicle", "subject": "scan", "body": "10.0.0.9"},
+            {"source": "icepick", "subject": "", "body": ""},
+        ]
+    )
+    assert index.matches("snowdog", "Unknown MAC", "DPT=67")
+    assert not index.matches("icicle", "Unknown MAC", "DPT=67")
+    assert index.matches("icicle", "port scan", "SRC=10.0.0.9")
+    assert not index.matches("icicle", "port scan", "SRC=10.0.0.8")
+    assert not index.matches("icepick", "anything", "anything")
+
+
+def test_many_filters_are_combined():
+    index = AlertFilterIndex(
+        [{"source": "snowdog", "body": f"device-{i}."} for i in range(5000)]
+    )
+    assert index.matches("snowdog", "", "seen device-4999.")
+    assert not index.matches("snowdog", "", "seen device-5000.")
+
+
+def test_typed_filters():
+    index = AlertFilterIndex(
+        [
+            {"source": "icicle", "type": "regex", "subject": r"port scan from 10\."},
+            {"source": "icicle", "type": "cidr", "body": "192.168.50.0/24"},
+            {"source": "snowdog", "type": "mac", "body": "DC-A6-32-01-02-03"},
+            {"source": "snowdog", "type": "cidr", "body": "not a network"},
+        ]
+    )
+    assert index.matches("icicle", "port scan from 10.1.2.3", "")
+    assert index.matches("icicle", "", "SRC=192.168.50.7 DST=10.0.0.1")
+    assert not index.matches("icicle", "", "SRC=192.168.51.7 DST=10.0.0.1")
+    assert index.matches("snowdog", "", "MAC=ff:ff:ff:ff:ff:ff:dc:a6:32:01:02:03:08:00")
+    assert index.matches("snowdog", "", "from dc:a6:32:01:02:03")
+    assert not index.matches("snowdog", "", "from dc:a6:32:01:02:04")
+
+
+def test_regex_filters_keep_flags_and_groups():
+    index = AlertFilterIndex(
+        [
+            {"source": "icicle", "type": "regex", "subject": "(?i)port scan"},
+            {"source": "icicle", "type": "regex", "subject": r"(b)\1"},
+            {"source": "icicle", "type": "regex", "subject": r"(a)\1"},
+            {"source": "icicle", "type": "regex", "subject": "(unclosed"},
+        ]
+    )
+    assert index.matches("icicle", "icebox1: PORT SCAN DETECTED", "")
+    assert index.matches("icicle", "aa", "")
+    assert index.matches("icicle", "bb", "")
+    assert not index.matches("icicle", "ab", "")
+
+
+def test_cidr_filters_match_icicle_alerts():
+    from icicle import Icicle
+
+    alerts = []
+    icicle = SimpleNamespace(
+        icebox_name="icebox1",
+        alerter=SimpleNamespace(alert=lambda **kwargs: alerts.append(kwargs)),
+    )
+    report = ScanReport("10.0.0.5", "CONNECTION", "2024-10-18", 1, [22], None)
+    Icicle.send_alert(icicle, report)
+    body = alerts[0]["body"]
+
+    index = AlertFilterIndex(
+        [{"source": "icicle", "type": "cidr", "body": "10.0.0.0/8"}]
+    )
+    assert "from 10.0.0.5.\n" in body
+    assert index.matches("icicle", alerts[0]["subject"], body)
+    assert index.matches("icicle", "", "connected to 10.1.2.3:443")
+    assert not index.matches("icicle", "", "from 192.168.0.5.")
+
+    index = AlertFilterIndex([{"source": "icicle", "type": "cidr", "body": "fd00::/8"}])
+    assert index.matches("icicle", "", "connection from fd00::5.")
+    assert not index.matches("icicle", "", "at 12:00:00 from fe80::1")
+
+
+def test_alerter_recompiles_on_config_change():
+    from modules.alerter import Alerter
+
+    Alerter._instance = None
+    store = ConfigStore()
+    store.update_config({})
+    alerter = Alerter()
+    alerter.configure_icewatch({})
+    alerter._send_icewatch_alert = lambda **kwargs: True
+
+    assert alerter.alert(source="snowdog", subject="new", body="DPT=67")
+    store.update_config({"alert_filters": [{"source": "snowdog", "body": "67"}]})
+    assert store.flush(timeout=5)
+    assert not alerter.alert(source="snowdog", subject="new", body="DPT=67")
+
+    alerter.shutdown(timeout=1)
+    Alerter._instance = None
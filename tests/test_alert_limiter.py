@@ -0,0 +1,55 @@
+import time
+
+from modules.alert_limiter import AlertLimiter
+from modules.alerter import Alerter
+from modules.config_store import ConfigStore
+
+
+def test_token_bucket_and_suppressed_count():
+    limiter = AlertLimiter({"burst": 2, "per_minute": 6})
+    key = ("icepick", "rule FAILED", "7")
+
+    assert limiter.check(key, now=0) == (True, "")
+    assert limiter.check(key, now=1) == (True, "")
+    assert limiter.check(key, now=2)[0] is False
+    assert limiter.check(key, now=3)[0] is False
+    # Other keys have their own bucket
+    assert limiter.check(("icepick", "rule FAILED", "8"), now=3)[0]
+
+    allowed, note = limiter.check(key, now=12)
+    assert allowed
+    assert note.startswith("2 similar alerts were suppressed")
+    assert limiter.check(key, now=13) == (False, "")
+
+
+def test_coalesce_window():
+    limiter = AlertLimiter({"burst": 100, "per_minute": 100, "coalesce_window": 30})
+    key = ("icicle", "PORT SCAN DETECTED", "10.0.0.9")
+
+    assert limiter.check(key, now=0)[0]
+    assert not limiter.check(key, now=10)[0]
+    assert not limiter.check(key, now=29)[0]
+    allowed, note = limiter.check(key, now=31)
+    assert allowed and note.startswith("2 similar alerts")
+
+
+def test_alerter_folds_suppressed_count_into_next_alert():
+    Alerter._instance = None
+    ConfigStore().update_config({"alert_rate_limit": {"burst": 1, "per_minute": 0}})
+    alerter = Alerter()
+    alerter.configure_icewatch({})
+    bodies = []
+    alerter._send_icewatch_alert = lambda body, **kwargs: bodies.append(body) or True
+
+    assert alerter.alert(source="snowdog", subject="new", body="a", key="aa")
+    assert not alerter.alert(source="snowdog", subject="new", body="a", key="aa")
+    assert alerter.alert(source="snowdog", subject="new", body="b", key="bb")
+
+    alerter._limiter.per_minute = 60000
+    time.sleep(0.01)
+    assert alerter.alert(source="snowdog", subject="new", body="a", key="aa")
+    alerter.shutdown(timeout=1)
+    Alerter._instance = None
+
+    assert bodies[:2] == ["a", "b"]
+    assert bodies[2].startswith("a\n\n1 similar alerts were suppressed")
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from modules.alerter import Alerter
+from modules.config_store import ConfigStore
+
+
+@pytest.fixture
+def alerter():
+    Alerter._instance = None
+    ConfigStore().update_config({})
+    alerter = Alerter()
+    yield alerter
+    alerter.shutdown(timeout=1)
+    Alerter._instance = None
+
+
+def test_slow_transport_does_not_block(alerter):
+    release = threading.Event()
+    sent = {"smtp": [], "icewatch": []}
+
+    def slow_smtp(subject, **kwargs):
+        release.wait(5)
+        sent["smtp"].append(subject)
+        return True
+
+    def icewatch(subject, **kwargs):
+        sent["icewatch"].append(subject)
+        return True
+
+    alerter._send_smtp_alert = slow_smtp
+    alerter._send_icewatch_alert = icewatch
+    alerter.configure_smtp({"sending_enabled": True})
+    alerter.configure_icewatch({})
+
+    start = time.monotonic()
+    for i in range(5):
+        assert alerter.alert(source="test", subject=f"alert {i}", body="")
+    assert time.monotonic() - start < 0.5
+
+    deadline = time.monotonic() + 2
+    while len(sent["icewatch"]) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(sent["icewatch"]) == 5
+    assert sent["smtp"] == []
+    assert alerter.get_stats()["smtp"]["queue_depth"] >= 4
+
+    release.set()
+    alerter.shutdown(timeout=2)
+    assert sent["smtp"] == [f"alert {i}" for i in range(5)]
+    stats = alerter.get_stats()
+    assert stats["smtp"]["delivered"] == 5
+    assert stats["smtp"]["queue_depth"] == 0
+    assert stats["icewatch"]["latency_max"] < 1
+    assert not alerter.alert(source="test", subject="late", body="")
+
+
+def test_shutdown_deadline(alerter):
+    alerter._send_smtp_alert = lambda **kwargs: time.sleep(10)
+    alerter.configure_smtp({"sending_enabled": True})
+    alerter.alert(source="test", subject="stuck", body="")
+    alerter.alert(source="test", subject="queued", body="")
+
+    start = time.monotonic()
+    alerter.shutdown(timeout=0.3)
+    assert time.monotonic() - start < 1
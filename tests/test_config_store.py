@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+
+from modules.config_store import ConfigStore, hash_config
+from modules.json_patch import apply_patch, parse_pointer
+
+
+@pytest.fixture
+def store():
+    ConfigStore._instance = None
+    store = ConfigStore()
+    yield store
+    ConfigStore._instance = None
+
+
+def test_version_and_hash_change_only_with_config(store):
+    config = {"icepick": [{"id": 1}], "smtp": {"to": "a@example.com"}}
+    store.update_config(config)
+    version = store.version
+
+    store.update_config({"icepick": [{"id": 1}], "smtp": {"to": "a@example.com"}})
+    assert store.version == version
+    assert store.config_hash == hash_config(config)
+
+    store.update_config({"icepick": []})
+    assert store.version == version + 1
+    assert store.config_hash == hash_config({"icepick": []})
+
+
+def test_patch_notifies_only_changed_subtrees(store):
+    store.update_config({"icepick": [{"id": 1}], "smtp": {"to": "a@example.com"}})
+    store.flush()
+    changes = {"icepick": [], "smtp": [], "smtp.to": [], "snowdog": []}
+    for key, seen in changes.items():
+        store.watch(key, seen.append)
+
+    store.apply_patch([{"op": "replace", "path": "/smtp/to", "value": "b@example.com"}])
+    assert store.flush(timeout=5)
+
+    assert changes == {
+        "icepick": [],
+        "smtp": [{"to": "b@example.com"}],
+        "smtp.to": ["b@example.com"],
+        "snowdog": [],
+    }
+
+
+def test_rejected_patch_leaves_config_unchanged(store):
+    store.update_config({"icepick": [{"id": 1}]})
+    version = store.version
+
+    with pytest.raises(ValueError):
+        store.apply_patch([{"op": "remove", "path": "/smtp"}])
+    with pytest.raises(ValueError):
+        store.apply_patch(
+            [{"op": "add", "path": "/icepick/-", "value": {"id": 2}}],
+            expected_hash="does-not-match",
+        )
+
+    assert store.get_config() == {"icepick": [{"id": 1}]}
+    assert store.version == version
+
+
+def test_apply_patch_copies_only_the_patched_path():
+    document = {"a": {"b": [1, 2]}, "c": {"d": 1}}
+
+    patched, changed = apply_patch(
+        document,
+        [
+            {"op": "add", "path": "/a/b/1", "value": 3},
+            {"op": "remove", "path": "/a/b/0"},
+            {"op": "add", "path": "/e~1f", "value": None},
+        ],
+    )
+
+    assert patched == {"a": {"b": [3, 2]}, "c": {"d": 1}, "e/f": None}
+    assert document == {"a": {"b": [1, 2]}, "c": {"d": 1}}
+    assert patched["c"] is document["c"]
+    assert changed == [("a", "b", "1"), ("a", "b", "0"), ("e/f",)]
+    assert parse_pointer("") == ()
+
+
+def test_accessor_follows_updates_and_patches(store):
+    learning = store.accessor("snowdog.learning", default=False)
+    assert learning.value is False
+
+    store.update_config({"snowdog": {"learning": True}})
+    assert learning.value is True
+
+    store.apply_patch([{"op": "remove", "path": "/snowdog/learning"}])
+    assert learning.value is False
+
+
+def test_snapshot_is_isolated_from_caller(store):
+    config = {"snowdog": {"learning": True}}
+    store.update_config(config)
+    config["snowdog"]["learning"] = False
+
+    assert store.get("snowdog.learning") is True
+    assert store.snapshot().config == {"snowdog": {"learning": True}}
+
+
+def test_observers_can_read_the_new_config(store):
+    seen = []
+    store.watch("snowdog", lambda value: seen.append(store.get("snowdog.alerting")))
+
+    store.update_config({"snowdog": {"alerting": True}})
+
+    assert store.flush(timeout=5)
+    assert seen == [True]
+
+
+def test_slow_observer_does_not_block_readers_and_updates_coalesce(store):
+    entered, release = threading.Event(), threading.Event()
+    seen = []
+
+    def slow_observer(value):
+        entered.set()
+        release.wait(5)
+        seen.append(value)
+
+    store.watch("snowdog.learning", slow_observer)
+    store.update_config({"snowdog": {"learning": 1}})
+    assert entered.wait(5)
+    for value in range(2, 6):
+        store.update_config({"snowdog": {"learning": value}})
+        assert store.get("snowdog.learning") == value
+    assert not store.flush(timeout=0.05)
+
+    release.set()
+    assert store.flush(timeout=5)
+    assert seen == [1, 5]
+
+
+def test_unwatch_prunes_the_observer_trie(store):
+    callback = lambda value: None  # noqa: E731
+    store.watch("a.b.c", callback)
+    store.watch("a.d", callback)
+
+    store.unwatch("a.b.c", callback)
+
+    assert list(store._observers.children["a"].children) == ["d"]
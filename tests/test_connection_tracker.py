@@ -0,0 +1,179 @@
+import threading
+
+from modules.connection_tracker import (
+    CONNECTION,
+    FLOOD_INTERVAL,
+    PING,
+    PORT_SCAN,
+    ConnectionTracker,
+    FloodReport,
+    PortSet,
+)
+
+
+def reported(tracker, now):
+    return [(r.src_address, r.classification) for r in tracker.due_reports(now=now)]
+
+
+def test_sources_are_reported_in_first_seen_order():
+    tracker = ConnectionTracker(window=1.0)
+    assert tracker.time_until_next_deadline(now=0) is None
+
+    assert tracker.record("10.0.0.1", "TCP", 22, now=0)
+    assert not tracker.record("10.0.0.2", "ICMP", 0, now=0.5)
+    assert not tracker.record("10.0.0.1", "TCP", 22, now=0.6)
+    assert tracker.time_until_next_deadline(now=0.25) == 0.75
+
+    assert reported(tracker, now=0.9) == []
+    reports = tracker.due_reports(now=1.0)
+    assert [(r.src_address, r.classification) for r in reports] == [
+        ("10.0.0.1", CONNECTION)
+    ]
+    assert reports[0].connections == 2
+    assert reports[0].ports == [22]
+    assert tracker.time_until_next_deadline(now=1.0) == 0.5
+    assert reported(tracker, now=2.0) == [("10.0.0.2", PING)]
+
+
+def test_fast_scan_is_one_alert():
+    tracker = ConnectionTracker()
+    for port in range(1, 101):
+        tracker.record("10.0.0.1", "TCP", port, now=port / 1000)
+
+    reports = tracker.due_reports(now=1.1)
+    assert [(r.classification, r.scan_window) for r in reports] == [(PORT_SCAN, "1s")]
+    assert len(reports[0].ports) == 100
+
+
+def test_slow_scan_is_reported_once_more_when_detected():
+    tracker = ConnectionTracker()
+    # One probe every 15 seconds, like nmap -T1
+    reports = []
+    for i in range(40):
+        tracker.record("10.0.0.1", "TCP", 1000 + i, now=i * 15.0)
+        for r in tracker.due_reports(now=i * 15.0 + 1):
+            reports.append((i, r.classification, r.scan_window))
+
+    assert reports == [(0, CONNECTION, None), (19, PORT_SCAN, "15m")]
+
+
+def test_ping_then_connection_is_reported_again():
+    tracker = ConnectionTracker()
+    tracker.record("10.0.0.1", "ICMP", 0, now=0)
+    assert reported(tracker, now=1) == [("10.0.0.1", PING)]
+
+    assert tracker.record("10.0.0.1", "TCP", 22, now=120)
+    assert reported(tracker, now=121) == [("10.0.0.1", CONNECTION)]
+    tracker.record("10.0.0.1", "ICMP", 0, now=130)
+    tracker.record("10.0.0.1", "TCP", 22, now=140)
+    assert reported(tracker, now=141) == []
+
+
+def test_connection_after_a_scan_is_reported():
+    tracker = ConnectionTracker()
+    tracker.record("10.0.0.1", "ICMP", 0, now=0)
+    assert reported(tracker, now=1) == [("10.0.0.1", PING)]
+    for i, port in enumerate(range(100, 121)):
+        tracker.record("10.0.0.1", "TCP", port, now=10 + i / 1000)
+    assert reported(tracker, now=11) == [("10.0.0.1", PORT_SCAN)]
+    # Stragglers from the scan are part of it
+    tracker.record("10.0.0.1", "TCP", 121, now=11.5)
+    assert reported(tracker, now=11.5) == []
+
+    tracker.record("10.0.0.1", "TCP", 8434, now=20)
+    assert reported(tracker, now=21) == [("10.0.0.1", CONNECTION)]
+
+
+def test_episode_ends_after_quiet_period():
+    tracker = ConnectionTracker(config={"episode_timeout": 60})
+    tracker.record("10.0.0.1", "TCP", 22, now=0)
+    assert reported(tracker, now=1) == [("10.0.0.1", CONNECTION)]
+
+    tracker.record("10.0.0.1", "TCP", 22, now=30)
+    assert reported(tracker, now=31) == []
+
+    tracker.record("10.0.0.1", "TCP", 22, now=100)
+    assert reported(tracker, now=101) == [("10.0.0.1", CONNECTION)]
+
+
+def test_thresholds_are_per_protocol():
+    tracker = ConnectionTracker(config={"thresholds": {"UDP": {"1s": 0, "1m": 3}}})
+    for port in range(5):
+        tracker.record("10.0.0.1", "UDP", port + 1, now=0)
+        tracker.record("10.0.0.2", "SCTP", port + 1, now=0)
+    tracker.record("10.0.0.1", "UDP", 9, now=10)
+
+    assert reported(tracker, now=1) == [
+        ("10.0.0.1", PORT_SCAN),
+        ("10.0.0.2", CONNECTION),
+    ]
+    assert reported(tracker, now=11) == []
+
+
+def test_least_recently_seen_sources_are_evicted():
+    tracker = ConnectionTracker(config={"max_sources": 2})
+    tracker.record("10.0.0.1", "TCP", 22, now=0)
+    tracker.record("10.0.0.2", "TCP", 22, now=0)
+    tracker.record("10.0.0.1", "TCP", 23, now=0.1)
+    tracker.record("10.0.0.3", "TCP", 22, now=0.2)
+
+    assert len(tracker) == 2
+    assert tracker.evicted == 1
+    assert reported(tracker, now=2) == [
+        ("10.0.0.1", CONNECTION),
+        ("10.0.0.3", CONNECTION),
+    ]
+
+
+def test_port_set_switches_to_bitmap():
+    ports = PortSet()
+    for port in [65535, 0, 443, 443] + list(range(1000, 1300)):
+        ports.add(port)
+
+    assert len(ports) == 303
+    assert 65535 in ports and 0 in ports and 999 not in ports
+    assert list(ports) == [0, 443] + list(range(1000, 1300)) + [65535]
+
+
+def test_concurrent_records_are_all_counted():
+    tracker = ConnectionTracker(window=60, config={"flood_sources": 10000})
+
+    def sweep(offset):
+        for i in range(1000):
+            tracker.record(f"10.{offset}.{i >> 8}.{i & 255}", "TCP", i)
+
+    threads = [threading.Thread(target=sweep, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(tracker) == 4000
+
+
+def test_flood_is_summarized_and_tracking_resumes():
+    tracker = ConnectionTracker(config={"flood_sources": 100})
+    tracker.record("192.168.1.10", "TCP", 22, now=0)
+    for i in range(5000):
+        tracker.record(f"10.0.{i >> 8}.{i & 255}", "TCP", 80, now=20 + i / 1000)
+        tracker.record("203.0.113.7", "TCP", i % 50, now=20 + i / 1000)
+
+    # Sources from before the flood are still tracked exactly
+    assert tracker.flooding
+    assert len(tracker) == 1
+    assert reported(tracker, now=26) == [("192.168.1.10", CONNECTION)]
+
+    flood = tracker.due_reports(now=21 + FLOOD_INTERVAL)
+    assert len(flood) == 1 and isinstance(flood[0], FloodReport)
+    assert 4500 < flood[0].sources < 5500
+    assert 9500 < flood[0].connections <= 10000
+    address, connections, ports = flood[0].top_sources[0]
+    assert address == "203.0.113.7"
+    assert connections > 4500
+    assert 40 < ports < 60
+
+    # Quiet intervals end flood mode without a second flood report
+    assert reported(tracker, now=20 + 3 * FLOOD_INTERVAL) == []
+    assert not tracker.flooding
+    tracker.record("10.9.9.9", "TCP", 22, now=60)
+    assert reported(tracker, now=61) == [("10.9.9.9", CONNECTION)]
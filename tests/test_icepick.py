@@ -0,0 +1,145 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from conftest import wait_for
+from modules.config_store import ConfigStore
+from icepick import Icepick
+
+
+def open_listener():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    return server
+
+
+def filtered_listener():
+    """A listener that drops SYNs, like a blackholing firewall rule."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(0)
+    clients = []
+    while True:
+        client = socket.socket()
+        client.settimeout(0.2)
+        try:
+            client.connect(server.getsockname())
+        except socket.timeout:
+            client.close()
+            return server, clients
+        clients.append(client)
+
+
+def rule(rule_id, server, success_action="pass", failure_action="pass"):
+    host, port = server.getsockname()
+    return {
+        "id": rule_id,
+        "name": f"rule {rule_id}",
+        "host": host,
+        "port": port,
+        "success_action": success_action,
+        "failure_action": failure_action,
+    }
+
+
+@pytest.fixture
+def icepick():
+    Icepick._instance = None
+    Icepick._initialized = False
+    ConfigStore().update_config(
+        {"icepick_settings": {"max_in_flight": 16, "timeout": 0.5}}
+    )
+    yield Icepick()
+    Icepick._instance = None
+    Icepick._initialized = False
+
+
+def probe_counts(icepick):
+    counts = {}
+    for result in icepick.get_latest_results():
+        counts[result["ruleId"]] = counts.get(result["ruleId"], 0) + 1
+    return counts
+
+
+def start(icepick):
+    thread = threading.Thread(target=icepick.run, daemon=True)
+    thread.start()
+    return thread
+
+
+def stop(icepick, thread):
+    icepick.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_run_probes_concurrently(icepick):
+    reachable = open_listener()
+    filtered, clients = filtered_listener()
+    # A short interval makes every rule due within the first 0.1s
+    icepick.set_connections(
+        [dict(rule(1, reachable), interval=0.1, jitter=0)]
+        + [dict(rule(i, filtered), interval=0.1, jitter=0) for i in range(2, 12)]
+    )
+
+    start_time = time.monotonic()
+    thread = start(icepick)
+    assert wait_for(lambda: len(probe_counts(icepick)) == 11)
+    elapsed = time.monotonic() - start_time
+    stop(icepick, thread)
+
+    # Run one at a time, the ten filtered probes would take 5s
+    assert elapsed < 2
+    results = {r["ruleId"]: r["result"] for r in icepick.get_latest_results()}
+    assert results[1] == "success"
+    assert [results[i] for i in range(2, 12)] == ["failure"] * 10
+
+    for sock in [reachable, filtered] + clients:
+        sock.close()
+
+
+def test_run_survives_a_failing_rule(icepick):
+    reachable = open_listener()
+    icepick.set_connections(
+        [
+            dict(rule(1, reachable, success_action="bogus"), interval=0.2, jitter=0),
+            dict(rule(2, reachable), interval=0.2, jitter=0),
+        ]
+    )
+
+    thread = start(icepick)
+    time.sleep(1.1)
+    stop(icepick, thread)
+
+    # The failing rule keeps being probed, and does not hold up the other
+    counts = probe_counts(icepick)
+    assert counts[1] >= 3
+    assert counts[2] >= 3
+    reachable.close()
+
+
+def test_rules_follow_their_own_interval(icepick):
+    reachable = open_listener()
+    fast = dict(rule(1, reachable), interval=0.2, jitter=0)
+    slow = dict(rule(2, reachable), interval=60, jitter=0)
+    icepick.set_connections([fast, slow])
+    thread = start(icepick)
+
+    time.sleep(1.1)
+    counts = probe_counts(icepick)
+    assert 4 <= counts[1] <= 7
+    assert counts.get(2, 0) <= 1
+
+    # Only the changed rule is rescheduled, and removed rules stop
+    icepick.results.acknowledge(icepick.results.snapshot()[0])
+    icepick.set_connections([dict(slow, interval=0.2)])
+    time.sleep(1.1)
+    counts = probe_counts(icepick)
+    assert 1 not in counts
+    assert counts[2] >= 4
+
+    stop(icepick, thread)
+    reachable.close()
@@ -0,0 +1,246 @@
+import gzip
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import icewatch
+from icepick import Icepick
+from icewatch import IcewatchClient
+from modules.config_store import ConfigStore, hash_config
+
+
+class IcewatchStandIn(ThreadingHTTPServer):
+    """A local Icewatch API that records requests and counts connections."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), IcewatchHandler)
+        self.connections = 0
+        self.requests = []
+        self.responses = {}
+        self.delays = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+
+class IcewatchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        endpoint = self.path.lstrip("/")
+        time.sleep(self.server.delays.get(endpoint, 0))
+        self.server.requests.append((endpoint, dict(self.headers), json.loads(body)))
+
+        status, payload = self.server.responses.get(endpoint, (200, {}))
+        if status == 304:
+            self.send_response(status)
+            self.end_headers()
+            return
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def icewatch_server():
+    server = IcewatchStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(icewatch_server, tmp_path):
+    IcewatchClient._instance = None
+    Icepick._instance = None
+    Icepick._initialized = False
+    ConfigStore._instance = None
+    ConfigStore().update_config({"icebox": {"name": "test"}})
+    client = IcewatchClient(
+        api_url=icewatch_server.url,
+        api_key="secret",
+        spool_path=str(tmp_path / "spool.sqlite"),
+    )
+    client.cached_config_path = tmp_path / "config-icewatch.json"
+    yield client
+    client.session.close()
+    client.spool.close()
+    IcewatchClient._instance = None
+    Icepick._instance = None
+    Icepick._initialized = False
+
+
+def test_requests_share_one_connection(client, icewatch_server):
+    for _ in range(3):
+        assert client.check_in()
+
+    assert icewatch_server.connections == 1
+    assert client.get_connection_stats() == {"requests": 3, "connections_opened": 1}
+    endpoint, headers, body = icewatch_server.requests[0]
+    assert endpoint == "check-in"
+    assert headers["x-api-key"] == "secret"
+    assert "Content-Encoding" not in headers
+
+
+def test_large_bodies_are_gzipped(client, icewatch_server, caplog):
+    for i in range(50):
+        IcewatchClient.queue_alert("icicle", f"scan {i}", "x" * 100, f"token-{i}")
+
+    with caplog.at_level(logging.DEBUG, logger="icewatch"):
+        assert client.send_alerts()
+
+    endpoint, headers, body = icewatch_server.requests[-1]
+    assert endpoint == "alert"
+    assert headers["Content-Encoding"] == "gzip"
+    assert int(headers["Content-Length"]) < len(json.dumps(body))
+    assert len(body["alerts"]) == 50
+
+
+def sent_subjects(icewatch_server):
+    return [
+        alert["subject"]
+        for endpoint, _, body in icewatch_server.requests
+        if endpoint == "alert"
+        for alert in body["alerts"]
+    ]
+
+
+def test_backlog_drains_in_order_after_failure(client, icewatch_server):
+    for i in range(250):
+        IcewatchClient.queue_alert("icicle", f"scan {i}", "", f"token-{i}")
+
+    icewatch_server.responses["alert"] = (503, {})
+    assert not client.send_alerts()
+    assert len(client.spool) == 250
+
+    icewatch_server.responses["alert"] = (200, {})
+    assert client.send_alerts()
+    assert len(client.spool) == 0
+    assert sent_subjects(icewatch_server) == [f"scan {i}" for i in range(100)] + [
+        f"scan {i}" for i in range(250)
+    ]
+
+
+def test_alerts_flush_while_check_in_hangs(client, icewatch_server, monkeypatch):
+    monkeypatch.setattr(icewatch, "ALERT_INTERVAL", 60)
+    icewatch_server.delays["check-in"] = 1.5
+    thread = threading.Thread(target=client.run, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+
+    # Crossing the flush threshold sends at once, not on the next interval
+    for i in range(icewatch.FLUSH_THRESHOLD):
+        IcewatchClient.queue_alert("icicle", f"scan {i}", "", f"token-{i}")
+    deadline = time.monotonic() + 1
+    while client.spool and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(client.spool) == 0
+    assert not any(e == "check-in" for e, _, _ in icewatch_server.requests)
+
+    client.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    # The connection pool is closed once the loops have stopped
+    assert not any(
+        adapter.poolmanager.pools for adapter in client.session.adapters.values()
+    )
+    # Alerts raised while the ice cubes shut down are still spooled
+    assert IcewatchClient.queue_alert("icicle", "late scan", "", "token-late")
+    assert len(client.spool) == 1
+
+
+def test_unchanged_config_is_not_rewritten(client, icewatch_server):
+    store = client.config_store
+    version = store.version
+    icewatch_server.responses["check-in"] = (304, {})
+
+    assert client.check_in()
+
+    _, headers, body = icewatch_server.requests[-1]
+    assert headers["If-None-Match"] == f'"{store.config_hash}"'
+    assert body["configHash"] == hash_config({"icebox": {"name": "test"}})
+    assert store.version == version
+    assert not client.cached_config_path.exists()
+    assert client.wait_for_initial_config(timeout=0)
+
+
+def test_config_patch_is_applied_and_cached(client, icewatch_server):
+    store = client.config_store
+    store.update_config({"icebox": {"name": "test"}, "icepick": []})
+    store.flush()
+    patched = {"icebox": {"name": "renamed"}, "icepick": []}
+    icewatch_server.responses["check-in"] = (
+        200,
+        {
+            "configPatch": [
+                {"op": "replace", "path": "/icebox/name", "value": "renamed"}
+            ],
+            "configHash": hash_config(patched),
+        },
+    )
+    icepick_changes = []
+    store.watch("icepick", icepick_changes.append)
+
+    assert client.check_in()
+
+    assert store.flush(timeout=5)
+    assert store.get_config() == patched
+    assert icepick_changes == []
+    with open(client.cached_config_path) as f:
+        assert json.load(f) == patched
+    assert list(client.cached_config_path.parent.glob(".*.tmp")) == []
+
+
+def test_failed_cache_write_does_not_fail_check_in(client, icewatch_server):
+    client.cached_config_path = client.cached_config_path.parent / "missing" / "c.json"
+    icewatch_server.responses["check-in"] = (200, {"config": {"icebox": {}}})
+
+    assert client.check_in()
+
+    assert client.config_store.get_config() == {"icebox": {}}
+    assert client.wait_for_initial_config(timeout=0)
+
+
+def test_bad_config_patch_requests_full_config(client, icewatch_server):
+    store = client.config_store
+    icewatch_server.responses["check-in"] = (
+        200,
+        {
+            "configPatch": [{"op": "replace", "path": "/icebox/name", "value": "x"}],
+            "configHash": "does-not-match",
+        },
+    )
+
+    assert client.check_in()
+    assert store.get("icebox.name") == "test"
+
+    icewatch_server.responses["check-in"] = (200, {"config": {"icebox": {}}})
+    assert client.check_in()
+    _, headers, body = icewatch_server.requests[-1]
+    assert body["configHash"] == ""
+    assert "If-None-Match" not in headers
+    assert store.get_config() == {"icebox": {}}
@@ -0,0 +1,293 @@
+import time
+import threading
+
+import pytest
+
+from conftest import wait_for
+from modules.log_watcher import LogTailer, LogWatcher
+
+
+@pytest.fixture
+def kern_log(tmp_path):
+    """A fresh kern.log and a fresh shared tailer for each test."""
+    LogTailer._instance = None
+    LogTailer().checkpoint_path = str(tmp_path / "checkpoint.json")
+    log_file = tmp_path / "kern.log"
+    log_file.write_text("old line ICICLE: SRC=10.0.0.1\n")
+    yield log_file
+    if LogTailer._instance is not None:
+        LogTailer._instance.stop()
+    LogTailer._instance = None
+
+
+def append(log_file, *lines):
+    with open(log_file, "a") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def test_single_reader_fans_out_by_tag(kern_log):
+    icicle_messages = []
+    snowdog_messages = []
+    icicle = LogWatcher(str(kern_log), "ICICLE", icicle_messages.append)
+    snowdog = LogWatcher(str(kern_log), "SNOWDOG", snowdog_messages.append)
+    icicle.start()
+    snowdog.start()
+    time.sleep(0.2)
+
+    readers = [t for t in threading.enumerate() if t.name.endswith("(watch_log_file)")]
+    assert len(readers) == 1
+
+    append(
+        kern_log,
+        "kernel: ICICLE: SRC=10.0.0.2 PROTO=TCP DPT=22",
+        "kernel: unrelated noise",
+        "kernel: SNOWDOG: MAC=ff:ff:ff:ff:ff:ff",
+    )
+
+    assert wait_for(lambda: icicle_messages and snowdog_messages)
+    assert icicle_messages == ["kernel: ICICLE: SRC=10.0.0.2 PROTO=TCP DPT=22"]
+    assert snowdog_messages == ["kernel: SNOWDOG: MAC=ff:ff:ff:ff:ff:ff"]
+
+    icicle.stop()
+    assert LogTailer()._thread.is_alive()
+    snowdog.stop()
+    assert not LogTailer()._thread.is_alive()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_new_lines_are_seen_promptly(kern_log, use_inotify):
+    messages = []
+    LogTailer().use_inotify = use_inotify
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.2)
+
+    start = time.time()
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.3 PROTO=ICMP TYPE=8")
+    assert wait_for(lambda: messages)
+    assert time.time() - start < 0.5
+    watcher.stop()
+
+
+def test_idle_tailer_does_not_wake(kern_log):
+    tailer = LogTailer()
+    check_rotation = tailer._check_rotation
+    checks = []
+
+    def counting_check_rotation(file):
+        checks.append(file)
+        return check_rotation(file)
+
+    tailer._check_rotation = counting_check_rotation
+    watcher = LogWatcher(str(kern_log), "ICICLE", lambda message: None)
+    watcher.start()
+    time.sleep(0.2)
+    checks.clear()
+
+    time.sleep(1.5)
+    assert checks == []
+    watcher.stop()
+
+
+def test_follows_moved_log_file(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.4")
+    kern_log.rename(kern_log.with_suffix(".log.1"))
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.5")
+
+    assert wait_for(lambda: len(messages) == 2)
+    assert messages[1] == "kernel: ICICLE: SRC=10.0.0.5"
+    watcher.stop()
+
+
+def test_rotated_file_is_read_until_the_writer_reopens(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+
+    # logrotate moves the file and creates an empty one, but the writer
+    # keeps appending to the old file until it is told to reopen
+    rotated = kern_log.with_suffix(".log.1")
+    kern_log.rename(rotated)
+    kern_log.write_text("")
+    time.sleep(0.2)
+    append(rotated, "kernel: ICICLE: SRC=10.0.0.4")
+    assert wait_for(lambda: len(messages) == 1)
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.5")
+
+    assert wait_for(lambda: len(messages) == 2, timeout=3)
+    assert messages == [
+        "kernel: ICICLE: SRC=10.0.0.4",
+        "kernel: ICICLE: SRC=10.0.0.5",
+    ]
+    watcher.stop()
+
+
+def test_follows_deleted_and_recreated_log_file(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.4")
+    assert wait_for(lambda: len(messages) == 1)
+    # Let the checkpoint save so the tailer waits without a timeout
+    time.sleep(0.2)
+    kern_log.unlink()
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.5")
+
+    assert wait_for(lambda: len(messages) == 2, timeout=3)
+    assert messages[1] == "kernel: ICICLE: SRC=10.0.0.5"
+    watcher.stop()
+
+
+def test_truncated_log_file_is_read_from_the_start(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+
+    kern_log.write_text("")
+    time.sleep(0.1)
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.6")
+
+    assert wait_for(lambda: messages)
+    assert messages == ["kernel: ICICLE: SRC=10.0.0.6"]
+    watcher.stop()
+
+
+def restart(kern_log, messages):
+    """Simulate an Icebox restart with a fresh tailer."""
+    checkpoint_path = LogTailer().checkpoint_path
+    LogTailer._instance = None
+    LogTailer().checkpoint_path = checkpoint_path
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    return watcher
+
+
+def test_backlog_is_replayed_after_restart(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+    watcher.stop()
+
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.7")
+    watcher = restart(kern_log, messages)
+    assert wait_for(lambda: messages)
+    assert messages == ["kernel: ICICLE: SRC=10.0.0.7"]
+    watcher.stop()
+
+
+def test_backlog_spanning_rotation_is_replayed(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+    watcher.stop()
+
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.8")
+    kern_log.rename(f"{kern_log}.1")
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.9")
+
+    watcher = restart(kern_log, messages)
+    assert wait_for(lambda: len(messages) == 2)
+    assert messages == [
+        "kernel: ICICLE: SRC=10.0.0.8",
+        "kernel: ICICLE: SRC=10.0.0.9",
+    ]
+    watcher.stop()
+
+
+def test_backlog_of_another_file_is_not_replayed(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+    watcher.stop()
+
+    other_log = kern_log.with_name("other.log")
+    other_log.write_text("kernel: ICICLE: SRC=10.0.0.11\n")
+    watcher = restart(other_log, messages)
+    time.sleep(0.3)
+    assert messages == []
+    watcher.stop()
+
+
+def test_backlog_is_not_replayed_when_no_file_matches(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+    watcher.stop()
+
+    # Moved somewhere the tailer does not look for a rotated file
+    kern_log.rename(kern_log.with_suffix(".old"))
+    kern_log.write_text("kernel: ICICLE: SRC=10.0.0.12\n")
+    watcher = restart(kern_log, messages)
+    time.sleep(0.3)
+    assert messages == []
+    watcher.stop()
+
+
+def test_stale_backlog_is_skipped(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+    watcher.stop()
+
+    append(kern_log, "kernel: ICICLE: SRC=10.0.0.10")
+    checkpoint_path = LogTailer().checkpoint_path
+    LogTailer._instance = None
+    LogTailer().checkpoint_path = checkpoint_path
+    LogTailer().max_catchup_age = 0
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.3)
+    assert messages == []
+    watcher.stop()
+
+
+def test_partial_lines_are_carried_over(kern_log):
+    messages = []
+    watcher = LogWatcher(str(kern_log), "ICICLE", messages.append)
+    watcher.start()
+    time.sleep(0.1)
+
+    with open(kern_log, "a") as f:
+        f.write("kernel: ICICLE: SRC=10.0.0.11 PRO")
+    time.sleep(0.2)
+    assert messages == []
+    append(kern_log, "TO=TCP")
+
+    assert wait_for(lambda: messages)
+    assert messages == ["kernel: ICICLE: SRC=10.0.0.11 PROTO=TCP"]
+    watcher.stop()
+
+
+def test_chunk_is_delivered_as_one_batch(kern_log):
+    batches = []
+    tailer = LogTailer()
+    tailer.set_file_path(str(kern_log))
+    tailer.subscribe("ICICLE", batches.append)
+    tailer.start()
+    time.sleep(0.1)
+
+    lines = []
+    for i in range(1000):
+        lines.append(f"kernel: noise {i}")
+        lines.append(f"kernel: ICICLE: SRC=10.1.{i // 256}.{i % 256}")
+    append(kern_log, *lines)
+
+    assert wait_for(lambda: sum(len(b) for b in batches) == 1000)
+    assert len(batches) < 10
+    assert batches[0][0] == "kernel: ICICLE: SRC=10.1.0.0"
+    tailer.unsubscribe("ICICLE", batches.append)
@@ -0,0 +1,55 @@
+import io
+
+from modules.mac import (
+    format_mac,
+    is_broadcast,
+    is_locally_administered,
+    is_multicast,
+    parse_mac,
+    read_macs,
+    write_macs,
+)
+import snowdog
+
+
+def test_parse_and_format():
+    assert parse_mac("AA-BB-CC-DD-EE-FF") == 0xAABBCCDDEEFF
+    assert format_mac(0x0A1B2C3D4E5F) == "0a:1b:2c:3d:4e:5f"
+
+
+def test_classification():
+    assert is_broadcast(parse_mac("ff:ff:ff:ff:ff:ff"))
+    assert is_multicast(parse_mac("01:00:5e:00:00:fb"))
+    assert is_multicast(parse_mac("33:33:00:00:00:01"))
+    assert not is_multicast(parse_mac("dc:a6:32:01:02:03"))
+    assert is_locally_administered(parse_mac("02:42:ac:11:00:02"))
+    assert not is_locally_administered(parse_mac("dc:a6:32:01:02:03"))
+
+
+def test_read_macs_formats():
+    lines = [
+        "mac_address,hostname",
+        "dc:a6:32:01:02:03,pi",
+        "10.0.0.1 dev eth0 lladdr 0a:1b:2c:3d:4e:5f REACHABLE",
+        "10.0.0.9 dev eth0  FAILED",
+        "? (10.0.0.7) at 00:11:22:33:44:55 [ether] on eth0",
+        "224.0.0.251 dev eth0 lladdr 01:00:5e:00:00:fb NOARP",
+    ]
+    assert list(read_macs(lines)) == [0xDCA632010203, 0x0A1B2C3D4E5F, 0x001122334455]
+
+
+def test_write_macs():
+    out = io.StringIO()
+    assert write_macs([1, 0xDCA632010203], out) == 2
+    assert out.getvalue() == "mac_address\n00:00:00:00:00:01\ndc:a6:32:01:02:03\n"
+
+
+def test_import_export_cli(tmp_path):
+    db_path = str(tmp_path / "snowdog.db")
+    neighbours = tmp_path / "neigh.txt"
+    neighbours.write_text("10.0.0.1 dev eth0 lladdr 0a:1b:2c:3d:4e:5f STALE\n")
+    exported = tmp_path / "macs.csv"
+
+    assert snowdog.main(["--db", db_path, "import", str(neighbours)]) == 0
+    assert snowdog.main(["--db", db_path, "export", str(exported)]) == 0
+    assert exported.read_text() == "mac_address\n0a:1b:2c:3d:4e:5f\n"
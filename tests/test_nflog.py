@@ -0,0 +1,99 @@
+import socket
+import struct
+
+import pytest
+
+from conftest import wait_for
+from modules.log_watcher import LogWatcher
+from modules.config_store import ConfigStore
+from modules import nflog
+from modules.nflog import NflogSource
+
+
+def ipv4_packet(src, dst, protocol, transport):
+    header = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + len(transport),
+        1,
+        0,
+        64,
+        protocol,
+        0,
+        socket.inet_aton(src),
+        socket.inet_aton(dst),
+    )
+    return header + transport
+
+
+def nflog_message(prefix, payload):
+    return nflog.build_packet_message(
+        {
+            nflog.NFULA_PREFIX: prefix + b"\0",
+            nflog.NFULA_HWHEADER: bytes.fromhex("ffffffffffff" "0a1b2c3d4e5f" "0800"),
+            nflog.NFULA_PAYLOAD: payload,
+        }
+    )
+
+
+@pytest.fixture
+def netlink():
+    """A socketpair standing in for the kernel's NFLOG netlink socket."""
+    kernel, icebox = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    NflogSource._instance = None
+    ConfigStore().update_config({"iptables": {"source": "nflog", "nflog_group": 7}})
+    NflogSource(socket_factory=lambda: icebox)
+    yield kernel
+    NflogSource._instance.stop()
+    NflogSource._instance = None
+    ConfigStore().update_config({})
+    kernel.close()
+
+
+def test_source_binds_to_the_configured_group(netlink):
+    watcher = LogWatcher("/var/log/kern.log", "ICICLE", lambda message: None)
+    watcher.start()
+
+    bind = None
+    while bind is None:
+        message = netlink.recv(4096)
+        attrs = nflog.parse_attributes(message, 20)
+        if attrs[nflog.NFULA_CFG_CMD] == bytes([nflog.NFULNL_CFG_CMD_BIND]):
+            bind = message
+    assert struct.unpack("!H", bind[18:20])[0] == 7
+    watcher.stop()
+
+
+def test_packets_become_log_lines_routed_by_prefix(netlink):
+    icicle_messages = []
+    snowdog_messages = []
+    icicle = LogWatcher("/var/log/kern.log", "ICICLE", icicle_messages.append)
+    snowdog = LogWatcher("/var/log/kern.log", "SNOWDOG", snowdog_messages.append)
+    icicle.start()
+    snowdog.start()
+
+    syn = struct.pack("!HHIIBBHHH", 51000, 22, 0, 0, 0x50, 0x02, 1024, 0, 0)
+    ping = bytes([8, 0, 0, 0, 0, 1, 0, 1])
+    netlink.send(
+        nflog_message(b"ICICLE: ", ipv4_packet("10.0.0.2", "10.0.0.1", 6, syn))
+        + nflog_message(b"ICICLE: ", ipv4_packet("10.0.0.3", "10.0.0.1", 1, ping))
+    )
+    netlink.send(
+        nflog_message(
+            b"SNOWDOG: ", ipv4_packet("10.0.0.4", "255.255.255.255", 17, syn[:8])
+        )
+    )
+
+    assert wait_for(lambda: len(icicle_messages) == 2 and snowdog_messages)
+    assert icicle_messages == [
+        "ICICLE: IN= OUT= MAC=ff:ff:ff:ff:ff:ff:0a:1b:2c:3d:4e:5f:08:00 "
+        "SRC=10.0.0.2 DST=10.0.0.1 LEN=40 TTL=64 PROTO=TCP SPT=51000 DPT=22",
+        "ICICLE: IN= OUT= MAC=ff:ff:ff:ff:ff:ff:0a:1b:2c:3d:4e:5f:08:00 "
+        "SRC=10.0.0.3 DST=10.0.0.1 LEN=28 TTL=64 PROTO=ICMP TYPE=8 CODE=0",
+    ]
+    assert "SRC=10.0.0.4 DST=255.255.255.255" in snowdog_messages[0]
+    assert "PROTO=UDP SPT=51000 DPT=22" in snowdog_messages[0]
+
+    icicle.stop()
+    snowdog.stop()
@@ -0,0 +1,47 @@
+from modules.mac import format_mac
+from modules.packet import PacketRecord
+
+TCP_LINE = (
+    "Oct 18 12:00:00 icebox1 kernel: [12345.678901] ICICLE: IN=eth0 OUT= "
+    "MAC=dc:a6:32:01:02:03:0a:1b:2c:3d:4e:5f:08:00 SRC=10.0.0.23 DST=10.0.0.5 "
+    "LEN=60 TOS=0x00 PREC=0x00 TTL=64 ID=54321 DF PROTO=TCP SPT=51234 DPT=22 "
+    "WINDOW=64240 RES=0x00 SYN URGP=0"
+)
+ICMP_ERROR_LINE = (
+    "ICICLE: IN=eth0 OUT= MAC=dc:a6:32:01:02:03:0a:1b:2c:3d:4e:5f:08:00 "
+    "SRC=10.0.0.1 DST=10.0.0.5 LEN=88 TTL=64 ID=2 PROTO=ICMP TYPE=3 CODE=3 "
+    "[SRC=10.0.0.5 DST=10.0.0.9 LEN=60 TTL=63 ID=7 PROTO=UDP SPT=53 DPT=5353 "
+    "LEN=40 ]"
+)
+
+
+def test_tcp_fields():
+    packet = PacketRecord(TCP_LINE)
+    assert packet.src == "10.0.0.23"
+    assert packet.dst == "10.0.0.5"
+    assert packet.proto == "TCP"
+    assert (packet.spt, packet.dpt, packet.icmp_type) == (51234, 22, None)
+    assert packet.kernel_timestamp == 12345.678901
+
+
+def test_icmp_error_ignores_quoted_header():
+    packet = PacketRecord(ICMP_ERROR_LINE)
+    assert packet.src == "10.0.0.1"
+    assert packet.proto == "ICMP"
+    assert packet.icmp_type == 3
+    assert packet.dpt is None
+    assert packet.kernel_timestamp is None
+
+
+def test_mac_addresses():
+    packet = PacketRecord(TCP_LINE)
+    assert format_mac(packet.src_mac) == "0a:1b:2c:3d:4e:5f"
+    assert format_mac(packet.dst_mac) == "dc:a6:32:01:02:03"
+
+
+def test_missing_fields():
+    packet = PacketRecord("ICICLE: IN=eth0 OUT= SRC=10.0.0.23 DST=10.0.0.5")
+    assert packet.src == "10.0.0.23"
+    assert packet.proto is None
+    assert packet.mac_addresses == (None, None)
+    assert PacketRecord("unrelated line").src is None
@@ -0,0 +1,41 @@
+from modules.result_store import ResultStore
+
+
+def test_snapshot_and_acknowledge():
+    store = ResultStore()
+    store.record("a", "failure", 5.0, 100.0)
+    store.record("b", "success", 0.01, 101.0)
+
+    sequence, results = store.snapshot()
+    assert [r["ruleId"] for r in results] == ["a", "b"]
+    assert store.snapshot()[1] is results
+
+    store.record("a", "failure", 5.0, 102.0)
+    store.acknowledge(sequence)
+    assert store.snapshot()[1] == [
+        {"ruleId": "a", "timestamp": 102.0, "result": "failure"}
+    ]
+
+
+def test_memory_is_bounded_while_undelivered():
+    store = ResultStore(capacity=10)
+    for i in range(10000):
+        store.record(str(i % 3), "failure", 0.0, float(i))
+
+    assert len(store.snapshot()[1]) == 30
+
+
+def test_rollups():
+    store = ResultStore()
+    for latency in range(1, 101):
+        store.record("a", "failure", latency / 1000, float(latency))
+    store.record("a", "success", 0.001, 200.0)
+    store.record("gone", "success", 0.001, 200.0)
+    store.retain(["a"])
+
+    rollups = store.rollups()
+    assert list(rollups) == ["a"]
+    assert rollups["a"]["lastState"] == "success"
+    assert rollups["a"]["lastChange"] == 200.0
+    assert (rollups["a"]["successes"], rollups["a"]["failures"]) == (1, 100)
+    assert rollups["a"]["latency"]["p99"] == 0.1
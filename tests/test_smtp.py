@@ -0,0 +1,126 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from conftest import wait_for
+from modules.alerter import Alerter
+from modules.config_store import ConfigStore
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an SMTP server to accept mail and count connections."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SmtpHandler)
+        self.connections = 0
+        self.messages = []
+        self.drop_next_message = False
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 stand-in ready")
+        for raw in self.rfile:
+            command = raw.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 stand-in")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                lines = []
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                    lines.append(data.decode())
+                if self.server.drop_next_message:
+                    self.server.drop_next_message = False
+                    return
+                self.server.messages.append("".join(lines))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server():
+    server = SmtpStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def alerter():
+    Alerter._instance = None
+    ConfigStore().update_config({})
+    alerter = Alerter()
+    yield alerter
+    alerter.shutdown(timeout=2)
+    Alerter._instance = None
+
+
+def smtp_config(server, **options):
+    host, port = server.server_address
+    return dict(
+        {
+            "sending_enabled": True,
+            "to": "admin@example.com",
+            "from": "icebox@example.com",
+            "smtp_server": host,
+            "smtp_port": port,
+            "tls": False,
+        },
+        **options,
+    )
+
+
+def test_session_is_reused(alerter, smtp_server):
+    alerter.configure_smtp(smtp_config(smtp_server))
+    for i in range(5):
+        alerter.alert(source="icicle", subject=f"scan {i}", body="")
+
+    assert wait_for(lambda: len(smtp_server.messages) == 5)
+    assert smtp_server.connections == 1
+
+
+def test_reconnects_after_failure_and_idle(alerter, smtp_server):
+    alerter.configure_smtp(smtp_config(smtp_server, idle_timeout=0.2))
+    alerter.alert(source="icicle", subject="first", body="")
+    assert wait_for(lambda: len(smtp_server.messages) == 1)
+
+    smtp_server.drop_next_message = True
+    alerter.alert(source="icicle", subject="second", body="")
+    assert wait_for(lambda: len(smtp_server.messages) == 2)
+    assert smtp_server.connections == 2
+    assert alerter.get_stats()["smtp"]["failed"] == 0
+
+    time.sleep(0.5)
+    alerter.alert(source="icicle", subject="third", body="")
+    assert wait_for(lambda: len(smtp_server.messages) == 3)
+    assert smtp_server.connections == 3
+
+
+def test_digest(alerter, smtp_server):
+    alerter.configure_smtp(smtp_config(smtp_server, digest_window=0.3))
+    for i in range(10):
+        alerter.alert(source="snowdog", subject=f"Unknown MAC {i}", body=f"mac {i}")
+
+    assert wait_for(lambda: smtp_server.messages)
+    time.sleep(0.2)
+    assert len(smtp_server.messages) == 1
+    assert "[snowdog] 10 alerts: Unknown MAC 0" in smtp_server.messages[0]
+    assert "mac 9" in smtp_server.messages[0]
+    assert alerter.get_stats()["smtp"]["delivered"] == 10
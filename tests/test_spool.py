@@ -0,0 +1,32 @@
+from modules.alerter import Alert
+from modules.spool import AlertSpool
+
+
+def alert(i):
+    return Alert("icicle", f"scan {i}", "body", float(i), f"token-{i}")
+
+
+def test_survives_restart_and_acknowledges_in_order(tmp_path):
+    path = str(tmp_path / "spool.sqlite")
+    spool = AlertSpool(path)
+    for i in range(5):
+        spool.append(alert(i))
+    batch = spool.peek(2)
+    assert [a.subject for _, a in batch] == ["scan 0", "scan 1"]
+    spool.acknowledge(batch[-1][0])
+    spool.close()
+
+    spool = AlertSpool(path)
+    assert len(spool) == 3
+    assert [a for _, a in spool.peek(10)] == [alert(2), alert(3), alert(4)]
+    spool.close()
+
+
+def test_bounded_size_drops_oldest(tmp_path):
+    spool = AlertSpool(str(tmp_path / "spool.sqlite"), max_alerts=3)
+    for i in range(10):
+        spool.append(alert(i))
+
+    assert len(spool) == 3
+    assert [a.subject for _, a in spool.peek(10)] == ["scan 7", "scan 8", "scan 9"]
+    spool.close()
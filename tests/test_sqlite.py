@@ -0,0 +1,82 @@
+import sqlite3
+
+from modules.sqlite import SQLiteDB
+
+
+def stored_macs(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT mac_address FROM mac_addresses")]
+
+
+def test_lookups_are_answered_before_the_write(tmp_path):
+    db_path = str(tmp_path / "snowdog.db")
+    db = SQLiteDB(db_path, flush_interval=60)
+
+    assert db.insert_mac_address(0xAABBCCDDEEFF)
+    assert not db.insert_mac_address(0xAABBCCDDEEFF)
+    assert db.is_known_mac(0xAABBCCDDEEFF)
+    assert stored_macs(db_path) == []
+
+    db.close()
+    assert stored_macs(db_path) == [0xAABBCCDDEEFF]
+
+
+def test_flush_on_size_and_reload(tmp_path):
+    db_path = str(tmp_path / "snowdog.db")
+    db = SQLiteDB(db_path, flush_interval=60, flush_size=3)
+    for i in range(3):
+        db.insert_mac_address(i)
+    assert len(stored_macs(db_path)) == 3
+    db.close()
+
+    reloaded = SQLiteDB(db_path, flush_interval=60)
+    assert reloaded.is_known_mac(2)
+    assert not reloaded.is_known_mac(3)
+    reloaded.close()
+
+
+def test_flush_on_timer(tmp_path):
+    db_path = str(tmp_path / "snowdog.db")
+    db = SQLiteDB(db_path, flush_interval=0.05)
+    db.insert_mac_address(0xAABBCCDDEEFF)
+    db._closed.wait(0.5)
+    assert stored_macs(db_path) == [0xAABBCCDDEEFF]
+    db.close()
+
+
+def test_migration_from_text_macs(tmp_path):
+    db_path = str(tmp_path / "snowdog.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE mac_addresses (id INTEGER PRIMARY KEY, "
+            "mac_address TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO mac_addresses (mac_address) VALUES (?)",
+            [("aa:bb:cc:dd:ee:ff",), ("aa:bb:cc:dd:ee:ff",), ("00:11:22:33:44:55",)],
+        )
+
+    db = SQLiteDB(db_path, flush_interval=60)
+    assert db.is_known_mac(0xAABBCCDDEEFF)
+    db.close()
+
+    assert stored_macs(db_path) == [0x001122334455, 0xAABBCCDDEEFF]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT 1 FROM mac_addresses WHERE mac_address = ?",
+            (0xAABBCCDDEEFF,),
+        ).fetchall()
+    assert "INTEGER PRIMARY KEY" in plan[0][-1]
+
+
+def test_bulk_insert(tmp_path):
+    db_path = str(tmp_path / "snowdog.db")
+    db = SQLiteDB(db_path, flush_interval=60)
+    db.insert_mac_address(1)
+
+    assert db.insert_mac_addresses(range(100000)) == 99999
+    assert db.known_macs()[:3] == [0, 1, 2]
+    assert len(stored_macs(db_path)) == 100000
+    db.close()